@@ -0,0 +1,235 @@
+"""
+Benchmarks of the game core, the environment and the server. Every benchmark is run for each
+combination of level sizes and numbers of dimensions, and the results are written to JSON so
+that runs can be compared:
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --output new.json --compare baseline.json --threshold 0.1
+"""
+import argparse
+import itertools
+import json
+import platform
+import time
+
+import numpy as np
+
+from ouroboros.level import Level
+from ouroboros.game import Game
+from ouroboros.environment import Ouroboros
+
+LEVEL_SIZES = [5, 9, 15]
+DIMS = [2, 3, 4]
+FILL_RATIOS = [0.0, 0.5, 0.9, 0.99]
+MIN_TIME = 0.2
+REPEATS = 5
+SEED = 0
+
+
+def measure(func, min_time: float = MIN_TIME) -> float:
+    """
+    Returns the mean time of a call to func(), calling it in batches until the batch
+    takes at least `min_time` seconds. The first call is a warm-up and isn't timed.
+    """
+    func()
+    n_calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(n_calls):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / n_calls
+        n_calls *= 2 if elapsed == 0 else max(2, int(1.5*min_time / elapsed))
+
+
+def random_direction(rng: np.random.Generator, n_dims: int) -> np.ndarray:
+    direction = np.zeros(n_dims, dtype=int)
+    direction[rng.integers(n_dims)] = rng.choice([-1, 1])
+    return direction
+
+
+def bench_game_move(level_size: int, n_dims: int, min_time: float) -> float:
+    """
+    Time of a Game.move with a random direction change. Games that end are restarted outside
+    of the timed section.
+    """
+    rng = np.random.default_rng(SEED)
+    directions = [random_direction(rng, n_dims) for _ in range(1024)]
+    level = Level(level_size=level_size, n_dims=n_dims)
+    game = Game(level=level, rng=rng)
+    n_moves = 0
+    elapsed = 0.0
+    while elapsed < min_time:
+        start = time.perf_counter()
+        while not game.finished:
+            game.change_direction(directions[n_moves % len(directions)])
+            game.move()
+            n_moves += 1
+        elapsed += time.perf_counter() - start
+        level.reset()
+        game = Game(level=level, rng=rng)
+    return elapsed / n_moves
+
+
+def bench_level_init(level_size: int, n_dims: int, min_time: float) -> float:
+    return measure(lambda: Level(level_size=level_size, n_dims=n_dims), min_time)
+
+
+def bench_level_reset(level_size: int, n_dims: int, min_time: float) -> float:
+    level = Level(level_size=level_size, n_dims=n_dims)
+    Game(level=level)
+    return measure(level.reset, min_time)
+
+
+def bench_get_obs(level_size: int, n_dims: int, min_time: float) -> float:
+    """
+    Time of Ouroboros._get_obs a few steps into an episode.
+    """
+    env = Ouroboros(level_size, n_dims)
+    env.reset(seed=SEED)
+    for action in range(n_dims*2):
+        _, _, terminated, truncated, _ = env.step(action % n_dims)
+        if terminated or truncated:
+            env.reset()
+    return measure(env._get_obs, min_time)
+
+
+def bench_choose_random_empty_position(level_size: int, n_dims: int, min_time: float,
+                                       fill_ratio: float) -> float:
+    """
+    Time of Level.choose_random_empty_position when `fill_ratio` of the cells are walls.
+    """
+    np.random.seed(SEED)
+    level = Level(level_size=level_size, n_dims=n_dims)
+    n_cells = len(level.flat_arr)
+    n_filled = min(int(fill_ratio*n_cells), n_cells - 1)
+    for flat_idx in np.random.permutation(n_cells)[:n_filled]:
+        level.set_flat(int(flat_idx), Level.WALL)
+    return measure(level.choose_random_empty_position, min_time)
+
+
+def bench_progress(level_size: int, n_dims: int, min_time: float, client) -> float:
+    """
+    End-to-end latency of /progress through the Flask test client. Games that end are
+    restarted outside of the timed section.
+    """
+    rng = np.random.default_rng(SEED)
+    n_requests = 0
+    elapsed = 0.0
+    while elapsed < min_time:
+        session_id = client.get(f"/init/{level_size}/{n_dims}").json["session_id"]
+        status = 0
+        while status == 0 and elapsed < min_time:
+            axis = int(rng.integers(1, n_dims + 1))
+            direction_int = axis if rng.random() < 0.5 else -axis
+            start = time.perf_counter()
+            response = client.get(f"/progress/{direction_int}?session_id={session_id}")
+            elapsed += time.perf_counter() - start
+            status = response.json["status"]
+            n_requests += 1
+    return elapsed / n_requests
+
+
+def run_benchmarks(level_sizes: list, dims: list, names: list, min_time: float, repeats: int) -> list:
+    """
+    Runs the selected benchmarks and returns one result per benchmark and configuration. The
+    reported time is the median over `repeats` runs.
+    """
+    benchmarks = {
+        "game_move": bench_game_move,
+        "level_init": bench_level_init,
+        "level_reset": bench_level_reset,
+        "get_obs": bench_get_obs,
+    }
+    for fill_ratio in FILL_RATIOS:
+        benchmarks[f"choose_random_empty_position[fill={fill_ratio}]"] = \
+            lambda s, d, t, fill_ratio=fill_ratio: bench_choose_random_empty_position(s, d, t, fill_ratio)
+    if any(name.startswith("progress") for name in names):
+        from server import app
+        client = app.test_client()
+        benchmarks["progress"] = lambda s, d, t: bench_progress(s, d, t, client)
+
+    results = []
+    for name, bench in benchmarks.items():
+        if not any(name.startswith(selected) for selected in names):
+            continue
+        for n_dims, level_size in itertools.product(dims, level_sizes):
+            times = [bench(level_size, n_dims, min_time) for _ in range(repeats)]
+            seconds = float(np.median(times))
+            result = {
+                "name": name,
+                "level_size": level_size,
+                "n_dims": n_dims,
+                "seconds": seconds,
+                "ops_per_sec": 1 / seconds,
+                "stdev_seconds": float(np.std(times)),
+            }
+            results.append(result)
+            print(f"{name:<45} size={level_size:<3} dims={n_dims}  "
+                  f"{seconds*1e6:>12.2f} us  {1/seconds:>12.0f} ops/s")
+    return results
+
+
+def compare(results: list, baseline: list, threshold: float) -> list:
+    """
+    Returns the results that are more than `threshold` (relative) slower than in the baseline.
+    """
+    baseline_seconds = {(r["name"], r["level_size"], r["n_dims"]): r["seconds"] for r in baseline}
+    regressions = []
+    for result in results:
+        key = (result["name"], result["level_size"], result["n_dims"])
+        if key not in baseline_seconds:
+            continue
+        change = result["seconds"] / baseline_seconds[key] - 1
+        if change > threshold:
+            regressions.append({**result, "baseline_seconds": baseline_seconds[key], "change": change})
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the Ouroboros game core, environment and server.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=LEVEL_SIZES)
+    parser.add_argument("--dims", nargs="+", type=int, default=DIMS)
+    parser.add_argument("--benchmarks", nargs="+",
+                        default=["game_move", "level_init", "level_reset", "get_obs",
+                                 "choose_random_empty_position", "progress"],
+                        help="Benchmarks to run, matched by prefix.")
+    parser.add_argument("--min_time", type=float, default=MIN_TIME,
+                        help="Minimum timed duration of every run in seconds.")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--output", default=None, help="JSON file to write the results to.")
+    parser.add_argument("--compare", default=None, help="JSON results of a baseline run.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown over the baseline reported as a regression.")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.dims, args.benchmarks, args.min_time, args.repeats)
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+    exit_code = 0
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        report["regressions"] = regressions
+        for regression in regressions:
+            print(f"REGRESSION {regression['name']} size={regression['level_size']} "
+                  f"dims={regression['n_dims']}: {regression['change']:+.1%}")
+        if regressions:
+            exit_code = 1
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
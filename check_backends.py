@@ -0,0 +1,141 @@
+"""
+Differential check of the game backends. Plays the same random games with every
+backend from the same seeds and checks that all states match the reference "python" backend.
+Also checks that games pickled halfway through play on like the originals:
+
+    python check_backends.py --games 200 --steps 500
+"""
+import argparse
+import pickle
+import time
+
+import numpy as np
+
+from ouroboros.level import Level
+from ouroboros.game import Game
+from ouroboros.kernels import BACKENDS
+
+CONFIGURATIONS = [(4, 2), (9, 2), (5, 3), (9, 3), (4, 4)]
+
+
+def game_state(game: Game) -> tuple:
+    """
+    Returns everything that makes up the observable state of a game.
+    """
+    level = game.level
+    return (level.arr.tolist(), sorted(level.empty_flat_positions[:level.n_empty].tolist()),
+            [int(flat_idx) for flat_idx in game.body_flat()], game.head_flat, game.curr_fruit_flat,
+            game.timestep, game.snake_length, game.latest_fruit_timestep, game.finished)
+
+
+def random_safe_action(game: Game, rng: np.random.Generator) -> int:
+    """
+    Returns a random action that doesn't end the game right away when there is one, so that
+    the checked games grow long snakes.
+    """
+    level = game.level
+    tail_flat = game.body_ring[game.body_start]
+    safe = []
+    for direction_idx, stride in enumerate(level.direction_strides):
+        if level.flat_out_of_bounds[direction_idx, game.head_flat]:
+            continue
+        cell = level.flat_arr[game.head_flat + stride]
+        if cell != Level.WALL and (cell != Level.BODY or game.head_flat + stride == tail_flat):
+            safe.append(direction_idx)
+    if not safe:
+        return int(rng.integers(2*level.ndim))
+    return safe[rng.integers(len(safe))]
+
+
+def check_parity(level_size: int, n_dims: int, n_games: int, n_steps: int, seed: int = 0) -> int:
+    """
+    Plays n_games games of up to n_steps random moves with every backend and asserts that
+    their states match after every move. Returns the number of moves checked.
+    """
+    rng = np.random.default_rng(seed)
+    n_moves = 0
+    for game_seed in rng.integers(2**31, size=n_games):
+        games = [Game(Level(level_size, n_dims), rng=int(game_seed), backend=backend) for backend in BACKENDS]
+        reference = games[0]
+        for _ in range(n_steps):
+            if reference.finished:
+                break
+            action = random_safe_action(reference, rng)
+            fruit_eaten = []
+            for game in games:
+                game.change_direction_idx(action)
+                fruit_eaten.append(game.move())
+            expected = game_state(reference)
+            for backend, game, eaten in zip(BACKENDS[1:], games[1:], fruit_eaten[1:]):
+                assert eaten == fruit_eaten[0], f"{backend}: fruit_eaten differs"
+                assert game_state(game) == expected, \
+                    f"{backend} differs from python (size {level_size}, dims {n_dims}, seed {game_seed}, timestep {reference.timestep})"
+            n_moves += 1
+    return n_moves
+
+
+def check_pickling(level_size: int, n_dims: int, n_games: int, n_steps: int, seed: int = 0) -> int:
+    """
+    Plays n_games games of up to n_steps random moves with every backend, pickles each game
+    halfway through and asserts that the copy plays on like the original, with flat_arr still
+    a view of arr. Returns the number of moves checked.
+    """
+    rng = np.random.default_rng(seed)
+    n_moves = 0
+    for game_seed in rng.integers(2**31, size=n_games):
+        for backend in BACKENDS:
+            game = Game(Level(level_size, n_dims), rng=int(game_seed), backend=backend)
+            copy = None
+            for step in range(n_steps):
+                if game.finished:
+                    break
+                if step == n_steps // 2:
+                    copy = pickle.loads(pickle.dumps(game))
+                    assert np.shares_memory(copy.level.arr, copy.level.flat_arr), "flat_arr is no longer a view of arr"
+                action = random_safe_action(game, rng)
+                for current in (game, copy):
+                    if current is not None:
+                        current.change_direction_idx(action)
+                        current.move()
+                if copy is not None:
+                    assert game_state(copy) == game_state(game), \
+                        f"pickled {backend} game differs (size {level_size}, dims {n_dims}, seed {game_seed}, timestep {game.timestep})"
+                    n_moves += 1
+    return n_moves
+
+
+def time_moves(level_size: int, n_dims: int, backend: str, n_moves: int = 20_000) -> float:
+    """
+    Returns the moves per second of random play with a backend.
+    """
+    rng = np.random.default_rng(0)
+    actions = rng.integers(2*n_dims, size=n_moves).tolist()
+    level = Level(level_size, n_dims)
+    game = Game(level, rng=0, backend=backend)
+    game.move()
+    start = time.perf_counter()
+    for action in actions:
+        if game.finished:
+            level.reset()
+            game = Game(level, rng=0, backend=backend)
+        game.change_direction_idx(action)
+        game.move()
+    return n_moves / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check that every game backend matches the reference.")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for level_size, n_dims in CONFIGURATIONS:
+        n_moves = check_parity(level_size, n_dims, args.games, args.steps, args.seed)
+        n_pickled_moves = check_pickling(level_size, n_dims, args.games, args.steps, args.seed)
+        speeds = ", ".join(f"{backend} {time_moves(level_size, n_dims, backend):.0f}/s" for backend in BACKENDS)
+        print(f"size={level_size} dims={n_dims}: {n_moves} moves match, {n_pickled_moves} after pickling - {speeds}")
+
+
+if __name__ == "__main__":
+    main()
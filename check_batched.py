@@ -0,0 +1,97 @@
+"""
+Differential check of BatchedGame against Game. Plays the same random games in a BatchedGame
+and in one Game per seed, resetting finished or stalled games like OuroborosVectorEnv does, and
+checks that the boards and states match after every step. Both draw from per-game Generators,
+so the games only depend on their seeds:
+
+    python check_batched.py --games 64 --steps 2000
+"""
+import argparse
+
+import numpy as np
+
+from ouroboros.level import Level
+from ouroboros.game import Game
+from ouroboros.batched_game import BatchedGame
+
+from check_backends import random_safe_action
+
+CONFIGURATIONS = [(4, 2), (9, 2), (5, 3), (4, 4)]
+
+
+def game_state(game: Game) -> tuple:
+    """
+    Returns the state of a game in the format of batched_state.
+    """
+    level = game.level
+    fruit_flat = -1 if game.curr_fruit_flat is None else int(game.curr_fruit_flat)
+    return (level.flat_arr.tolist(), sorted(level.empty_flat_positions[:level.n_empty].tolist()),
+            [int(flat_idx) for flat_idx in game.body_flat()], int(game.head_flat), fruit_flat,
+            game.timestep, game.snake_length, game.latest_fruit_timestep, game.finished)
+
+
+def batched_state(batched: BatchedGame, i: int) -> tuple:
+    """
+    Returns the state of game i of a BatchedGame.
+    """
+    return (batched.flat_boards[i].tolist(), sorted(batched.empty_flat_positions[i, :batched.n_empty[i]].tolist()),
+            batched.body_flat(i).tolist(), int(batched.head_flat[i]), int(batched.curr_fruit_pos[i]),
+            int(batched.timestep[i]), int(batched.snake_length[i]), int(batched.latest_fruit_timestep[i]),
+            bool(batched.finished[i]))
+
+
+def check_parity(level_size: int, n_dims: int, n_games: int, n_steps: int, seed: int = 0) -> tuple:
+    """
+    Steps n_games games n_steps times in a BatchedGame and in per-seed Games and asserts that
+    every game matches after every step. A game that finishes or doesn't eat for as many
+    timesteps as the level has cells is reset, and its Game is recreated on the same level with
+    the same generator. Returns the number of steps checked and the number of resets.
+    """
+    rng = np.random.default_rng(seed)
+    seeds = rng.integers(2**31, size=n_games).tolist()
+    batched = BatchedGame(n_games, level_size, n_dims, seeds=seeds)
+    games = [Game(Level(level_size, n_dims), rng=np.random.default_rng(game_seed)) for game_seed in seeds]
+    max_timesteps = len(games[0].level.flat_arr)
+    directions = np.zeros((n_games, n_dims), dtype=int)
+    n_checked, n_resets = 0, 0
+
+    for step in range(n_steps):
+        for i, game in enumerate(games):
+            direction_idx = random_safe_action(game, rng)
+            game.change_direction_idx(direction_idx)
+            game.move()
+            directions[i] = game.level.direction_vector(direction_idx)
+        batched.change_direction(directions)
+        batched.move()
+
+        done = [i for i, game in enumerate(games)
+                if game.finished or game.timestep - game.latest_fruit_timestep >= max_timesteps]
+        if done:
+            batched.reset(done)
+            for i in done:
+                level = games[i].level
+                level.reset()
+                games[i] = Game(level, rng=games[i].rng)
+            n_resets += len(done)
+
+        for i, game in enumerate(games):
+            assert batched_state(batched, i) == game_state(game), \
+                f"game {i} differs (size {level_size}, dims {n_dims}, seed {seeds[i]}, step {step})"
+            n_checked += 1
+    return n_checked, n_resets
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check that BatchedGame matches per-seed Games.")
+    parser.add_argument("--games", type=int, default=32)
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for level_size, n_dims in CONFIGURATIONS:
+        n_checked, n_resets = check_parity(level_size, n_dims, args.games, args.steps, args.seed)
+        print(f"size={level_size} dims={n_dims}: {n_checked} game steps match, across {n_resets} resets")
+
+
+if __name__ == "__main__":
+    main()
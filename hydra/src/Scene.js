@@ -72,6 +72,7 @@ export default function Scene() {
     const dimGroupRef = useRef();
 
     const gameStartedRef = useRef(false);
+    const sessionIdRef = useRef();
     const meshReference = useRef();
 
     const baseMaterial = new THREE.Material();
@@ -138,7 +139,9 @@ export default function Scene() {
 
     const handleSnakeMove = () => {
         if (gameStartedRef.current) {
-            baseInstance.get("/progress/" + lastDirectionalInputRef.current).then((data) => {
+            baseInstance.get("/progress/" + lastDirectionalInputRef.current, {
+                params: { session_id: sessionIdRef.current }
+            }).then((data) => {
                 if (data?.data?.diff) {
                     if (data.data.status > 0) {
                         gameStartedRef.current = false;
@@ -179,6 +182,7 @@ export default function Scene() {
 
     const createNewGame = () => {
         baseInstance.get("/init/" + selectedLevelSize + "/" + selectedDimNum).then((data) => {
+            sessionIdRef.current = data.data.session_id;
             setEntireMap(data.data.state);
             setDimensionsMatrix(new Array(selectedDimNum).fill(selectedLevelSize));
             gameStartedRef.current = true;
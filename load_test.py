@@ -0,0 +1,105 @@
+"""
+Load test for the game server. Every client thread creates its own session through /init and
+then calls /progress in a loop, reporting requests per second and latency percentiles.
+
+    python load_test.py --sessions 64 --duration 10
+    python load_test.py --url http://127.0.0.1:5000 --sessions 256 --encoding binary
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.request
+from typing import Optional
+
+import numpy as np
+
+
+class Client:
+    """
+    Minimal HTTP client over either a running server at `url` or the in-process Flask test client.
+    """
+    def __init__(self, url: Optional[str] = None) -> None:
+        self.url = url
+        if url is None:
+            from server import app
+            self.test_client = app.test_client()
+
+    def get(self, path: str) -> "tuple[int, bytes, dict]":
+        if self.url is None:
+            response = self.test_client.get(path)
+            return response.status_code, response.data, response.headers
+        with urllib.request.urlopen(self.url.rstrip("/") + path) as response:
+            return response.status, response.read(), response.headers
+
+
+def run_session(client: Client, level_size: int, n_dims: int, encoding: str,
+                deadline: float, latencies: list, errors: list) -> None:
+    """
+    Plays random moves in one session until the deadline, restarting the game when it ends.
+    """
+    rng = np.random.default_rng()
+    session_id = None
+    while time.perf_counter() < deadline:
+        if session_id is None:
+            status, data, headers = client.get(f"/init/{level_size}/{n_dims}?encoding={encoding}")
+            if encoding == "binary":
+                session_id = headers["X-Session-Id"]
+            else:
+                session_id = json.loads(data)["session_id"]
+
+        axis = int(rng.integers(1, n_dims + 1))
+        direction_int = axis if rng.random() < 0.5 else -axis
+        start = time.perf_counter()
+        status, data, _ = client.get(f"/progress/{direction_int}?session_id={session_id}&encoding={encoding}")
+        latencies.append(time.perf_counter() - start)
+
+        if status != 200:
+            errors.append(status)
+            session_id = None
+            continue
+        if encoding == "binary":
+            game_status = int(np.frombuffer(data, dtype="<i4", count=1)[0])
+        else:
+            game_status = json.loads(data)["status"]
+        if game_status != 0:
+            session_id = None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the /progress endpoint.")
+    parser.add_argument("--url", default=None,
+                        help="Server to test. Defaults to the in-process Flask test client.")
+    parser.add_argument("--sessions", type=int, default=32, help="Number of concurrent sessions.")
+    parser.add_argument("--duration", type=float, default=10, help="Test duration in seconds.")
+    parser.add_argument("--level_size", type=int, default=9)
+    parser.add_argument("--n_dims", type=int, default=2)
+    parser.add_argument("--encoding", default="json", choices=["json", "base64", "binary"])
+    args = parser.parse_args()
+
+    client = Client(args.url)
+    deadline = time.perf_counter() + args.duration
+    latencies = [[] for _ in range(args.sessions)]
+    errors = []
+    threads = [threading.Thread(target=run_session,
+                                args=(client, args.level_size, args.n_dims, args.encoding,
+                                      deadline, latencies[i], errors))
+               for i in range(args.sessions)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = np.concatenate([np.asarray(session_latencies) for session_latencies in latencies]) * 1000
+    print(f"sessions: {args.sessions}, requests: {len(latencies)}, errors: {len(errors)}")
+    print(f"requests/sec: {len(latencies) / elapsed:.1f}")
+    if len(latencies) > 0:
+        p50, p99 = np.percentile(latencies, [50, 99])
+        print(f"latency ms: mean {latencies.mean():.2f}, p50 {p50:.2f}, p99 {p99:.2f}, max {latencies.max():.2f}")
+
+
+if __name__ == "__main__":
+    main()
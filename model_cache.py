@@ -0,0 +1,67 @@
+"""
+Cache of loaded agents so that the server only deserializes each model once.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from train import get_model_class, get_model_path
+
+
+class ModelCache:
+    """
+    Thread-safe LRU cache of loaded models keyed by (model_name, n_dims, level_size,
+    train_timesteps). At most `max_models` models are kept. Concurrent requests for a model
+    that is still loading wait for the same load instead of loading it again.
+    """
+    def __init__(self, max_models: int = 8) -> None:
+        self.max_models = max_models
+        self.models = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.models)
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self.models
+
+    def get(self, model_name: str, n_dims: int, level_size: int, train_timesteps: int):
+        """
+        Returns the model trained under the given configuration, loading it on a cache miss.
+        """
+        key = (model_name, n_dims, level_size, train_timesteps)
+        with self.lock:
+            future = self.models.get(key)
+            is_loader = future is None
+            if is_loader:
+                future = Future()
+                self.models[key] = future
+                while len(self.models) > self.max_models:
+                    self.models.popitem(last=False)
+            else:
+                self.models.move_to_end(key)
+
+        if is_loader:
+            try:
+                model_class = get_model_class(model_name)
+                model_path = get_model_path(model_name, n_dims, level_size, train_timesteps)
+                future.set_result(model_class.load(model_path))
+            except Exception as e:
+                with self.lock:
+                    if self.models.get(key) is future:
+                        del self.models[key]
+                future.set_exception(e)
+
+        return future.result()
+
+    def preload(self, configurations: list) -> None:
+        """
+        Loads the models of the given (model_name, n_dims, level_size, train_timesteps)
+        configurations, up to the size of the cache. Models that fail to load are skipped, and
+        their error is raised again when they are requested.
+        """
+        for configuration in configurations[:self.max_models]:
+            try:
+                self.get(*configuration)
+            except Exception:
+                continue
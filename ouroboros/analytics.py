@@ -0,0 +1,307 @@
+"""
+Reachability analytics of the free space (empty and fruit cells) of a game, kept up to date
+move by move instead of flood-filling the level on every step.
+"""
+from collections import deque
+from itertools import product
+
+import numpy as np
+
+from ouroboros.level import Level
+from ouroboros.game import FlatGame
+
+
+class ReachabilityIndex:
+    """
+    Connected components of the free space of a game, stored as a union-find over component
+    labels. A move changes at most two cells: the new head leaves the free space and the old
+    tail joins it. Costs per move, for a level with d dimensions:
+    - A freed tail cell merges the components around it in O(d).
+    - A cell taken by the head costs O(3^d) when its free neighbors are still connected
+      through the cells around it, which is the common case. Otherwise the component may
+      split, and searches from every side run in lockstep until all but one side have been
+      fully explored, costing O(d^2) per cell of the smaller sides.
+    - Every query below is O(d).
+    reset() labels the whole level in O(d*n) for n cells.
+    Fruit distance is the Manhattan distance from the head. Path lengths around obstacles
+    aren't maintained; see ouroboros.planning.shortest_path for them.
+    """
+    FEATURE_NAMES = ["head_space", "tail_reachable", "fruit_reachable", "fruit_distance"]
+
+    def __init__(self, level: Level) -> None:
+        self.level = level
+        flat_length = len(level.flat_arr)
+        self.max_distance = sum(size - 1 for size in level.shape)
+
+        # Neighbor flat indices of every cell.
+        self.neighbors = [[] for _ in range(flat_length)]
+        for direction_idx, stride in enumerate(level.direction_strides):
+            for flat_idx in np.flatnonzero(~level.flat_out_of_bounds[direction_idx]).tolist():
+                self.neighbors[flat_idx].append(flat_idx + stride)
+
+        # Cells around a cell (offsets in {-1, 0, 1}^d except 0) and which of them are
+        # neighbors of each other, for the local connectivity test.
+        offsets = [offset for offset in product((-1, 0, 1), repeat=level.ndim) if any(offset)]
+        box_offsets = np.array(offsets)
+        self.box_strides = box_offsets @ np.array(level.strides)
+        coords = np.indices(level.shape).reshape(level.ndim, flat_length).T
+        box_coords = coords[:, None, :] + box_offsets[None, :, :]
+        self.box_in_bounds = np.all((box_coords >= 0) & (box_coords < np.array(level.shape)), axis=2)
+        self.box_adjacency = [[j for j, other in enumerate(offsets)
+                               if sum(abs(a - b) for a, b in zip(offset, other)) == 1]
+                              for offset in offsets]
+        self.box_center = [i for i, offset in enumerate(offsets) if sum(map(abs, offset)) == 1]
+
+        self.game = None
+        self.labels = []
+        self.parents = []
+        self.sizes = []
+        self.n_components = 0
+
+    def reset(self, game: FlatGame) -> None:
+        """
+        Labels the free space of a game played on the index's level.
+        """
+        assert game.level is self.level
+        self.game = game
+        flat_arr = self.level.flat_arr
+        free = (flat_arr == Level.EMPTY) | (flat_arr == Level.FRUIT)
+        self.labels = [-1]*len(flat_arr)
+        self.parents = []
+        self.sizes = []
+        for start in np.flatnonzero(free).tolist():
+            if self.labels[start] == -1:
+                self._label_component(start, self._new_label())
+        self.n_components = len(self.sizes)
+
+    def _new_label(self) -> int:
+        label = len(self.parents)
+        self.parents.append(label)
+        self.sizes.append(0)
+        return label
+
+    def _label_component(self, start: int, label: int) -> None:
+        """
+        Labels the unlabeled free cells connected to start.
+        """
+        flat_arr = self.level.flat_arr
+        labels = self.labels
+        labels[start] = label
+        stack = [start]
+        size = 0
+        while stack:
+            flat_idx = stack.pop()
+            size += 1
+            for next_flat in self.neighbors[flat_idx]:
+                if labels[next_flat] == -1 and (flat_arr[next_flat] == Level.EMPTY or flat_arr[next_flat] == Level.FRUIT):
+                    labels[next_flat] = label
+                    stack.append(next_flat)
+        self.sizes[label] = size
+
+    def _find(self, label: int) -> int:
+        parents = self.parents
+        while parents[label] != label:
+            parents[label] = parents[parents[label]]
+            label = parents[label]
+        return label
+
+    def update(self, old_head_flat: int, old_tail_flat: int) -> None:
+        """
+        Updates the index after a move of the game, given where its head and tail were before.
+        """
+        game = self.game
+        if game.head_flat == old_head_flat:
+            return
+        if self.labels[game.head_flat] != -1:
+            self._remove(game.head_flat)
+        if self.level.flat_arr[old_tail_flat] == Level.EMPTY and self.labels[old_tail_flat] == -1:
+            self._add(old_tail_flat)
+
+    def _add(self, flat_idx: int) -> None:
+        """
+        Adds a cell to the free space, merging the components around it.
+        """
+        roots = {self._find(self.labels[next_flat]) for next_flat in self.neighbors[flat_idx]
+                 if self.labels[next_flat] != -1}
+        if not roots:
+            root = self._new_label()
+            self.n_components += 1
+        else:
+            root = max(roots, key=self.sizes.__getitem__)
+            for other in roots - {root}:
+                self.parents[other] = root
+                self.sizes[root] += self.sizes[other]
+                self.n_components -= 1
+        self.labels[flat_idx] = root
+        self.sizes[root] += 1
+
+    def _remove(self, flat_idx: int) -> None:
+        """
+        Removes a cell from the free space, splitting its component when it has to.
+        """
+        labels = self.labels
+        root = self._find(labels[flat_idx])
+        labels[flat_idx] = -1
+        self.sizes[root] -= 1
+        if self.sizes[root] == 0:
+            self.n_components -= 1
+            return
+        free_neighbors = [next_flat for next_flat in self.neighbors[flat_idx] if labels[next_flat] != -1]
+        if len(free_neighbors) <= 1:
+            return
+        sides = self._local_sides(flat_idx)
+        if len(sides) > 1:
+            self._split(root, sides)
+
+    def _local_sides(self, flat_idx: int) -> list:
+        """
+        Returns one free neighbor of the cell for every group of its free neighbors that are
+        connected through the free cells around it.
+        """
+        box_flat = (flat_idx + self.box_strides).tolist()
+        free = [inside and self.labels[flat] != -1
+                for inside, flat in zip(self.box_in_bounds[flat_idx].tolist(), box_flat)]
+
+        seen = [False]*len(box_flat)
+        sides = []
+        for start in self.box_center:
+            if not free[start] or seen[start]:
+                continue
+            sides.append(box_flat[start])
+            seen[start] = True
+            stack = [start]
+            while stack:
+                i = stack.pop()
+                for j in self.box_adjacency[i]:
+                    if free[j] and not seen[j]:
+                        seen[j] = True
+                        stack.append(j)
+        return sides
+
+    def _split(self, root: int, sides: list) -> None:
+        """
+        Explores a component from several sides at once, one cell per side in turn, until at
+        most one group of connected sides is still growing. The groups that were fully explored
+        are given new labels, and the rest of the component keeps its label.
+        """
+        labels = self.labels
+        n_sides = len(sides)
+        owners = {flat_idx: i for i, flat_idx in enumerate(sides)}
+        queues = [deque([flat_idx]) for flat_idx in sides]
+        visited = [[flat_idx] for flat_idx in sides]
+        groups = list(range(n_sides))
+
+        def find_group(i):
+            while groups[i] != i:
+                i = groups[i]
+            return i
+
+        while True:
+            for i in range(n_sides):
+                if not queues[i]:
+                    continue
+                flat_idx = queues[i].popleft()
+                for next_flat in self.neighbors[flat_idx]:
+                    if labels[next_flat] == -1:
+                        continue
+                    owner = owners.get(next_flat)
+                    if owner is None:
+                        owners[next_flat] = i
+                        visited[i].append(next_flat)
+                        queues[i].append(next_flat)
+                    else:
+                        group, other_group = find_group(i), find_group(owner)
+                        if group != other_group:
+                            groups[other_group] = group
+            all_groups = {find_group(i) for i in range(n_sides)}
+            if len(all_groups) == 1:
+                return
+            growing = {find_group(i) for i in range(n_sides) if queues[i]}
+            if len(growing) <= 1:
+                break
+
+        explored = {}
+        for i in range(n_sides):
+            if find_group(i) not in growing:
+                explored.setdefault(find_group(i), []).extend(visited[i])
+        if not growing:
+            # Every side was explored, so the largest one keeps the label.
+            del explored[max(explored, key=lambda group: len(explored[group]))]
+        for cells in explored.values():
+            label = self._new_label()
+            for flat_idx in cells:
+                labels[flat_idx] = label
+            self.sizes[label] = len(cells)
+            self.sizes[root] -= len(cells)
+            self.n_components += 1
+
+    def _head_roots(self) -> set:
+        return {self._find(self.labels[next_flat]) for next_flat in self.neighbors[self.game.head_flat]
+                if self.labels[next_flat] != -1}
+
+    def component_size(self, flat_idx: int) -> int:
+        """
+        Returns the number of free cells connected to a free cell, or 0 for other cells.
+        """
+        if self.labels[flat_idx] == -1:
+            return 0
+        return self.sizes[self._find(self.labels[flat_idx])]
+
+    def head_space(self) -> int:
+        """
+        Returns the number of free cells the head can reach.
+        """
+        return sum(self.sizes[root] for root in self._head_roots())
+
+    def tail_reachable(self) -> bool:
+        """
+        Returns True when the head can reach the tail through free cells, ignoring the cells
+        the rest of the body leaves on the way.
+        """
+        game = self.game
+        tail_flat = game.body_ring[game.body_start]
+        if game.body_length == 1 or tail_flat in self.neighbors[game.head_flat]:
+            return True
+        tail_roots = {self._find(self.labels[next_flat]) for next_flat in self.neighbors[tail_flat]
+                      if self.labels[next_flat] != -1}
+        return not tail_roots.isdisjoint(self._head_roots())
+
+    def fruit_reachable(self) -> bool:
+        """
+        Returns True when the head can reach the fruit through free cells.
+        """
+        fruit_flat = self.game.curr_fruit_flat
+        if fruit_flat is None:
+            return False
+        return self._find(self.labels[fruit_flat]) in self._head_roots()
+
+    def fruit_distance(self) -> int:
+        """
+        Returns the Manhattan distance from the head to the fruit, or 0 without fruit.
+        """
+        fruit_flat = self.game.curr_fruit_flat
+        if fruit_flat is None:
+            return 0
+        head = self.level.position(self.game.head_flat)
+        fruit = self.level.position(fruit_flat)
+        return int(sum(abs(int(h) - int(f)) for h, f in zip(head, fruit)))
+
+    def info(self) -> dict:
+        return {
+            "head_space": self.head_space(),
+            "tail_reachable": self.tail_reachable(),
+            "fruit_reachable": self.fruit_reachable(),
+            "fruit_distance": self.fruit_distance(),
+            "n_components": self.n_components,
+        }
+
+    def features(self) -> np.ndarray:
+        """
+        Returns the analytics named in FEATURE_NAMES, scaled to [0, 1].
+        """
+        return np.array([
+            self.head_space() / len(self.labels),
+            self.tail_reachable(),
+            self.fruit_reachable(),
+            self.fruit_distance() / max(1, self.max_distance),
+        ], dtype=np.float32)
@@ -0,0 +1,226 @@
+"""
+Batched N-dimensional snake. Steps many independent games at once with vectorized operations.
+"""
+from typing import Optional, Sequence
+
+import numpy as np
+
+from ouroboros.level import Level
+
+
+class BatchedGame:
+    """
+    Batched game object. Holds `n_games` boards in one array of shape (n_games, *level_shape)
+    along with per-game head, body, direction and fruit arrays. Game i draws from its own
+    Generator seeded with seeds[i], in the same order as Game, so it follows the same states as
+    `Game(rng=seeds[i])` and, after a reset, as a new Game on the same generator. check_batched.py
+    checks this step by step.
+    Finished games are frozen until they are reset.
+    """
+
+    def __init__(self, n_games: int, level_size: Optional[int] = 9, n_dims: Optional[int] = 2,
+                 arr: Optional[np.ndarray] = None, seeds: Optional[Sequence[int]] = None) -> None:
+        """
+        Batched game initialization. Every game starts from the same level, which is full of
+        empty cells by default. When arr is provided, it overrides other arguments defining the
+        level and should only contain empty cells, walls, and extra fruit.
+        """
+        if arr is None:
+            level_shape = (level_size,)*n_dims
+            arr = np.full(shape=level_shape, fill_value=Level.EMPTY)
+        if seeds is None:
+            seeds = [None]*n_games
+        assert len(seeds) == n_games
+
+        self.n_games = n_games
+        self.shape = arr.shape
+        self.ndim = arr.ndim
+        self.n_cells = int(np.prod(self.shape))
+        self.template = arr.flatten()
+        self.template_empty = np.flatnonzero(self.template == Level.EMPTY)
+        self.template_empty_slots = np.full(self.n_cells, -1)
+        self.template_empty_slots[self.template_empty] = np.arange(len(self.template_empty))
+        self.rngs = [np.random.default_rng(seed) for seed in seeds]
+
+        self.boards = np.empty((n_games, *self.shape), dtype=self.template.dtype)
+        self.flat_boards = self.boards.reshape(n_games, self.n_cells)
+        self.strides = np.array([int(np.prod(self.shape[i+1:])) for i in range(self.ndim)])
+        self.upper_bounds = np.array(self.shape)
+        self.rows = np.arange(n_games)
+
+        # The body of game i is a ring buffer holding flat indices from tail to head.
+        self.body_capacity = self.n_cells + 1
+        self.body = np.zeros((n_games, self.body_capacity), dtype=int)
+        self.body_start = np.zeros(n_games, dtype=int)
+        self.body_length = np.zeros(n_games, dtype=int)
+
+        self.head = np.zeros((n_games, self.ndim), dtype=int)
+        self.head_flat = np.zeros(n_games, dtype=int)
+        self.direction = np.zeros((n_games, self.ndim), dtype=int)
+        self.curr_fruit_pos = np.full(n_games, -1)
+
+        # Per-game free-lists of empty cells, kept in the same order as Level's free-list.
+        self.empty_flat_positions = np.zeros((n_games, self.n_cells), dtype=int)
+        self.empty_slots = np.full((n_games, self.n_cells), -1)
+        self.n_empty = np.zeros(n_games, dtype=int)
+
+        self.timestep = np.zeros(n_games, dtype=int)
+        self.snake_length = np.zeros(n_games, dtype=int)
+        self.latest_fruit_timestep = np.zeros(n_games, dtype=int)
+        self.finished = np.zeros(n_games, dtype=bool)
+
+        self.reset()
+
+    def reset(self, game_ids: Optional[Sequence[int]] = None) -> None:
+        """
+        Restart the given games (all games by default) on a fresh copy of the level.
+        """
+        if game_ids is None:
+            game_ids = self.rows
+        game_ids = np.asarray(game_ids, dtype=int)
+        n_reset = len(game_ids)
+
+        # Only the RNG draws are done per game, in the same order as Game.__init__.
+        start_idx = np.zeros(n_reset, dtype=int)
+        rand_dim = np.zeros(n_reset, dtype=int)
+        rand_sign = np.zeros(n_reset, dtype=int)
+        fruit_idx = np.zeros(n_reset, dtype=int)
+        n_template_empty = len(self.template_empty)
+        assert n_template_empty > 0
+        for k, i in enumerate(game_ids):
+            rng = self.rngs[i]
+            start_idx[k] = rng.integers(n_template_empty)
+            rand_dim[k] = rng.integers(self.ndim)
+            rand_sign[k] = (-1, 1)[rng.integers(2)]
+            if n_template_empty > 1:
+                fruit_idx[k] = rng.integers(n_template_empty - 1)
+
+        start_flat = self.template_empty[start_idx]
+        self.flat_boards[game_ids] = self.template
+        self.empty_flat_positions[game_ids, :n_template_empty] = self.template_empty
+        self.empty_slots[game_ids] = self.template_empty_slots
+        self.n_empty[game_ids] = n_template_empty
+        self._remove_empty(game_ids, start_flat)
+        self.flat_boards[game_ids, start_flat] = Level.HEAD
+        self.direction[game_ids] = 0
+        self.direction[game_ids, rand_dim] = rand_sign
+        self.head_flat[game_ids] = start_flat
+        self.head[game_ids] = np.stack(np.unravel_index(start_flat, shape=self.shape), axis=-1)
+        self.body[game_ids, 0] = start_flat
+        self.body_start[game_ids] = 0
+        self.body_length[game_ids] = 1
+
+        self.timestep[game_ids] = 0
+        self.snake_length[game_ids] = 2
+        self.latest_fruit_timestep[game_ids] = 0
+        self.finished[game_ids] = n_template_empty == 1
+
+        if n_template_empty > 1:
+            fruit_flat = self.empty_flat_positions[game_ids, fruit_idx]
+            self.flat_boards[game_ids, fruit_flat] = Level.FRUIT
+            self.curr_fruit_pos[game_ids] = fruit_flat
+            self._remove_empty(game_ids, fruit_flat)
+        else:
+            self.curr_fruit_pos[game_ids] = -1
+
+    def _add_empty(self, game_ids: np.ndarray, flat_indices: np.ndarray) -> None:
+        """
+        Append one cell to the free-list of each given game.
+        """
+        self.empty_flat_positions[game_ids, self.n_empty[game_ids]] = flat_indices
+        self.empty_slots[game_ids, flat_indices] = self.n_empty[game_ids]
+        self.n_empty[game_ids] += 1
+
+    def _remove_empty(self, game_ids: np.ndarray, flat_indices: np.ndarray) -> None:
+        """
+        Remove one cell from the free-list of each given game by moving the last entry
+        into its slot.
+        """
+        slots = self.empty_slots[game_ids, flat_indices]
+        last_flat_indices = self.empty_flat_positions[game_ids, self.n_empty[game_ids]-1]
+        self.empty_flat_positions[game_ids, slots] = last_flat_indices
+        self.empty_slots[game_ids, last_flat_indices] = slots
+        self.empty_slots[game_ids, flat_indices] = -1
+        self.n_empty[game_ids] -= 1
+
+    def _spawn_fruit(self, game_ids: np.ndarray) -> None:
+        """
+        Spawn a fruit in a random empty cell of each given game. Finishes the games that have
+        no empty cells left.
+        """
+        full = self.n_empty[game_ids] == 0
+        self.curr_fruit_pos[game_ids[full]] = -1
+        self.finished[game_ids[full]] = True
+
+        game_ids = game_ids[~full]
+        slots = np.array([self.rngs[i].integers(self.n_empty[i]) for i in game_ids], dtype=int)
+        fruit_flat = self.empty_flat_positions[game_ids, slots]
+        self.flat_boards[game_ids, fruit_flat] = Level.FRUIT
+        self.curr_fruit_pos[game_ids] = fruit_flat
+        self._remove_empty(game_ids, fruit_flat)
+
+    def change_direction(self, directions: np.ndarray) -> None:
+        """
+        Change the direction of every snake. `directions` has shape (n_games, ndim).
+        """
+        self.direction[:] = directions
+
+    def move(self) -> np.ndarray:
+        """
+        Move every unfinished snake by one timestep. Returns a boolean array that is True for
+        games where a fruit was eaten.
+        """
+        live = ~self.finished
+        self.timestep[live] += 1
+
+        new_head = self.head + self.direction
+        out_of_bounds = np.any((new_head < 0) | (new_head >= self.upper_bounds), axis=1)
+        new_head_flat = np.where(out_of_bounds, 0, new_head @ self.strides)
+        new_cells = self.flat_boards[self.rows, new_head_flat]
+        tail_flat = self.body[self.rows, self.body_start]
+
+        collided = out_of_bounds | (new_cells == Level.WALL)
+        collided |= (new_cells == Level.BODY) & (new_head_flat != tail_flat)
+        self.finished |= live & collided
+        moving = live & ~collided
+        fruit_eaten = moving & (new_cells == Level.FRUIT)
+
+        # Add to the snake's body from the head.
+        ids = np.flatnonzero(moving)
+        new_ids_flat = new_head_flat[ids]
+        self.flat_boards[ids, new_ids_flat] = Level.HEAD
+        self.flat_boards[ids, self.head_flat[ids]] = Level.BODY
+        self.body[ids, (self.body_start[ids] + self.body_length[ids]) % self.body_capacity] = new_ids_flat
+        self.body_length[ids] += 1
+        self.snake_length[ids] += 1
+        self.head[ids] = new_head[ids]
+        self.head_flat[ids] = new_ids_flat
+        entered_empty = new_cells[ids] == Level.EMPTY
+        self._remove_empty(ids[entered_empty], new_ids_flat[entered_empty])
+
+        # Remove the end of the tail unless it was just replaced by the head.
+        ids = np.flatnonzero(moving & ~fruit_eaten)
+        cleared_ids = ids[tail_flat[ids] != new_head_flat[ids]]
+        self.flat_boards[cleared_ids, tail_flat[cleared_ids]] = Level.EMPTY
+        self._add_empty(cleared_ids, tail_flat[cleared_ids])
+        self.body_start[ids] = (self.body_start[ids] + 1) % self.body_capacity
+        self.body_length[ids] -= 1
+
+        ids = np.flatnonzero(fruit_eaten)
+        self._spawn_fruit(ids)
+        self.latest_fruit_timestep[ids] = self.timestep[ids]
+
+        return fruit_eaten
+
+    def body_flat(self, i: int) -> np.ndarray:
+        """
+        Returns the flat indices of the body of game i, ordered from tail to head.
+        """
+        offsets = np.arange(self.body_length[i])
+        return self.body[i, (self.body_start[i] + offsets) % self.body_capacity]
+
+    def won(self) -> np.ndarray:
+        """
+        Returns a boolean array that is True for games that have been won.
+        """
+        return self.finished & (self.n_empty == 0)
@@ -0,0 +1,75 @@
+"""
+Curriculum of levels that get harder as the agent gets better.
+"""
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+from ouroboros.generation import LevelBank
+
+
+class Curriculum:
+    """
+    Scheduler that moves through stages of level banks. Every stage is a LevelBank of the same
+    shape, usually holding smaller or lower-dimensional regions embedded in walls (see
+    ouroboros.generation.embed_layout), so a single policy can play all stages.
+    Episodes are scored by the fraction of the level's free cells that the snake filled. The
+    next stage starts once the mean score of the last `window` episodes of the current stage
+    reaches `threshold`.
+    """
+
+    def __init__(self, stages: list, threshold: float = 0.5, window: int = 100) -> None:
+        assert len(stages) > 0
+        assert all(bank.shape == stages[0].shape for bank in stages)
+        self.stages = stages
+        self.shape = stages[0].shape
+        self.threshold = threshold
+        self.window = window
+        self.stage = 0
+        self.scores = deque(maxlen=window)
+
+    @property
+    def bank(self) -> LevelBank:
+        """
+        Level bank of the current stage.
+        """
+        return self.stages[self.stage]
+
+    def record(self, score: float) -> bool:
+        """
+        Records the score of an episode. Returns True when it moved the curriculum to the
+        next stage.
+        """
+        self.scores.append(score)
+        if self.stage == len(self.stages) - 1 or len(self.scores) < self.window:
+            return False
+        if np.mean(self.scores) < self.threshold:
+            return False
+        self.stage += 1
+        self.scores.clear()
+        return True
+
+
+def make_curriculum(level_size: int, n_dims: int, kind: str = "empty", n_levels: int = 64,
+                    seed: Optional[int] = None, threshold: float = 0.5, window: int = 100,
+                    **kwargs) -> Curriculum:
+    """
+    Returns a curriculum for a level_size^n_dims environment. It starts on 2D regions of size 4
+    and doubles their size up to level_size, then does the same for every extra dimension. The
+    layouts of every stage are generated with `kind` (see ouroboros.generation.LAYOUTS).
+    """
+    shape = (level_size,)*n_dims
+    stages = []
+    for region_dims in range(2, n_dims + 1):
+        region_size = 4
+        while True:
+            region_size = min(region_size, level_size)
+            region = (region_size,)*region_dims
+            stage_seed = None if seed is None else seed + len(stages)
+            stages.append(LevelBank.generate(n_levels, kind, shape, stage_seed, region, **kwargs))
+            if region_size == level_size:
+                break
+            region_size *= 2
+
+    return Curriculum(stages, threshold, window)
@@ -5,10 +5,16 @@ from typing import Optional
 
 import numpy as np
 import gymnasium as gym
-import pygame
 
 from ouroboros.level import Level
 from ouroboros.game import Game
+from ouroboros.observation import make_observation_encoder
+from ouroboros.recording import open_recording
+from ouroboros.profiling import Profiler, ENV_PHASES, RECORDER_PHASES, ANALYTICS_PHASES
+from ouroboros.rendering import make_renderer
+from ouroboros.generation import LevelBank
+from ouroboros.curriculum import Curriculum
+from ouroboros.analytics import ReachabilityIndex
 
 
 class Ouroboros(gym.Env):
@@ -16,65 +22,161 @@ class Ouroboros(gym.Env):
     Environment wrapper for Ouroboros.
     """
     
-    metadata = {"render_modes": ["human", "hydra"], "render_fps": 5}
+    metadata = {"render_modes": ["human", "rgb_array", "hydra"], "render_fps": 5}
 
     def __init__(self, level_size: int, n_dims: int,
-                 render_mode: Optional[str] = None, max_timesteps: Optional[int] = None) -> None:
+                 render_mode: Optional[str] = None, max_timesteps: Optional[int] = None,
+                 obs_aging: str = "head", copy_obs: bool = True, obs_mode: str = "dense",
+                 obs_dtype = int, obs_radius: Optional[int] = None,
+                 recording_path: Optional[str] = None, profile: bool = False,
+                 backend: str = "python", level_bank: Optional[LevelBank] = None,
+                 curriculum: Optional[Curriculum] = None, analytics: bool = False,
+                 analytics_obs: bool = False) -> None:
         """
         Environment initialization. Actions come from a Discrete space of size n_dims*2.
         Observations come from an integer Box space. `max_timesteps` is the max number of
         timesteps that the snake doesn't eat before the episode is truncated.
+        With `obs_aging="head"`, body cells are numbered from the head (head is 1). With
+        `obs_aging="birth"`, body cells hold 1 plus the number of moves made before they became
+        the head, so the body never has to be renumbered. In "birth" mode, `copy_obs=False`
+        returns the internal observation buffer itself, which is overwritten on the next step.
+        `obs_mode` selects a more compact encoding (see ouroboros.observation): "dense" boards
+        of `obs_dtype`, binary "channels", bit-"packed" channels, or an "egocentric" window
+        of radius `obs_radius` around the head.
+        The "human" and "rgb_array" render modes draw to a window or offscreen. Levels with more
+        than 2 dimensions are drawn as a montage of 2D slices (see ouroboros.rendering).
+        In "hydra" render mode, every episode is recorded to `recording_path` (see
+        ouroboros.recording). Without a path, it goes to a temporary file that close() deletes.
+        With `profile=True`, the time spent in every phase of a step is measured by
+        `self.profiler` (see ouroboros.profiling) and its stats are added to the info of the
+        last step of every episode under "profile".
+        `backend` selects the implementation of the game's moves (see ouroboros.kernels).
+        With a `level_bank` (see ouroboros.generation), every episode is played on a random
+        template of the bank instead of an empty level. With a `curriculum` (see
+        ouroboros.curriculum), templates come from the bank of its current stage, and the
+        score of every finished episode is recorded to it. The info holds the stage under
+        "curriculum_stage". Banks must have the shape of the environment's levels.
+        With `analytics=True`, a ReachabilityIndex (see ouroboros.analytics) is updated on every
+        step and its values are added to the info. Updates usually cost O(3^n_dims) per step;
+        see ReachabilityIndex for the bounds. With `analytics_obs=True`, observations become
+        dicts of the "board" observation and the index's "analytics" features.
         """
+        assert obs_aging in ("head", "birth")
+        assert obs_aging == "head" or (obs_mode == "dense" and obs_dtype == int)
         self.level_size = level_size
         self.n_dims = n_dims
+        self.obs_aging = obs_aging
+        self.copy_obs = copy_obs
 
+        self.backend = backend
+        self.level_bank = level_bank
+        self.curriculum = curriculum
         level = Level(level_size, n_dims)
-        self.game = Game(level=level)
+        for bank in (level_bank, curriculum):
+            assert bank is None or bank.shape == level.shape
+        self.n_free_cells = level.n_empty
+        self.game = Game(level=level, rng=self.np_random, backend=backend)
+        flat_length = len(self.game.level.flat_arr)
         if max_timesteps is None:
-            flat_length = np.prod(self.game.level.shape)
             self.max_timesteps = flat_length*4
         else:
             self.max_timesteps = max_timesteps
         
-        self.observation_space = gym.spaces.Box(0, flat_length-1, shape=(flat_length,), dtype=int)
+        self.obs_mode = obs_mode
+        self.obs_encoder = make_observation_encoder(level, obs_mode, obs_dtype, obs_radius)
+        if obs_aging == "head":
+            self.observation_space = self.obs_encoder.observation_space
+        else:
+            self.observation_space = gym.spaces.Box(Level.WALL, np.iinfo(int).max, shape=(flat_length,), dtype=int)
         self.action_space = gym.spaces.Discrete(n_dims*2)
 
+        self.analytics = None
+        if analytics or analytics_obs:
+            self.analytics = ReachabilityIndex(level)
+            self.analytics.reset(self.game)
+        self.analytics_obs = analytics_obs
+        if analytics_obs:
+            n_features = len(ReachabilityIndex.FEATURE_NAMES)
+            self.observation_space = gym.spaces.Dict({
+                "board": self.observation_space,
+                "analytics": gym.spaces.Box(0, 1, shape=(n_features,), dtype=np.float32),
+            })
+
         assert render_mode is None or render_mode in self.metadata["render_modes"]
         self.render_mode = render_mode
 
         self.expansion = 20
-        self.cell_colors = {
-            Level.HEAD:  175,
-            Level.EMPTY: 0,
-            Level.BODY: 150,
-            Level.FRUIT: 255,
-            Level.WALL: 20,
-        }
-        self.cell_color_map = np.vectorize(lambda key: self.cell_colors[key])
-        
-        self.window = None
-        self.clock = None
+        self.renderer = None
+        # Cells changed since the last frame, so the renderer only redraws them. None until
+        # the first frame of an episode, which compares the whole level.
+        self.render_changed_flat = None
+
+        self.recorder = None
+        if render_mode == "hydra":
+            self.recorder = open_recording(recording_path)
+
+        # Flat level where body cells hold HEAD plus their birth move. Kept up to date by only
+        # writing the cells that change on each step.
+        self.obs_buffer = np.zeros(flat_length, dtype=int)
+        self.n_head_moves = 0
+        self._reset_obs_buffer()
 
-        self.history = [[]]
-        self.episode_counter = 0
+        self.profiler = None
+        if profile:
+            self.profiler = Profiler()
+            self.profiler.instrument(self, ENV_PHASES)
+            self.profiler.instrument_game(self.game)
+            if self.recorder is not None:
+                self.profiler.instrument(self.recorder, RECORDER_PHASES)
+            if self.analytics is not None:
+                self.profiler.instrument(self.analytics, ANALYTICS_PHASES)
+
+    def _reset_obs_buffer(self) -> None:
+        """
+        Rebuilds the observation buffer from the current game.
+        """
+        np.copyto(self.obs_buffer, self.game.level.flat_arr)
+        self.n_head_moves = self.game.body_length - 1
+        for birth, flat_idx in enumerate(self.game.body_flat()):
+            self.obs_buffer[flat_idx] = Level.HEAD + birth
+
+    def _update_obs_buffer(self, old_head_flat: int, old_tail_flat: int, fruit_eaten: bool) -> None:
+        """
+        Updates the observation buffer after a move. Only the new head, the removed tail and
+        the new fruit are written.
+        """
+        game = self.game
+        if game.head_flat == old_head_flat:
+            return
+        self.n_head_moves += 1
+        if not fruit_eaten:
+            self.obs_buffer[old_tail_flat] = game.level.flat_arr[old_tail_flat]
+        elif game.curr_fruit_flat is not None:
+            self.obs_buffer[game.curr_fruit_flat] = Level.FRUIT
+        self.obs_buffer[game.head_flat] = Level.HEAD + self.n_head_moves
      
     def _get_obs(self) -> np.ndarray:
         """
         Returns current observation.
         """
-        obs_arr = self.game.level.arr.copy()
-        counter = Level.HEAD
-        for pos in reversed(self.game.body):
-            obs_arr[pos] = counter
-            counter += 1
-
-        return obs_arr.flatten()
+        if self.obs_aging == "birth":
+            board = self.obs_buffer.copy() if self.copy_obs else self.obs_buffer
+        else:
+            board = self.obs_encoder.encode(self.obs_buffer, self.game.level, self.game.head_flat)
+        if self.analytics_obs:
+            return {"board": board, "analytics": self.analytics.features()}
+        return board
 
     def _get_info(self) -> np.ndarray:
         """
         Returns auxiliary information.
         """
-        return {'snake_length': self.game.snake_length}
+        info = {'snake_length': self.game.snake_length}
+        if self.curriculum is not None:
+            info['curriculum_stage'] = self.curriculum.stage
+        if self.analytics is not None:
+            info.update(self.analytics.info())
+        return info
     
     def action_to_direction(self, action: int) -> np.ndarray:
         """
@@ -90,15 +192,30 @@ class Ouroboros(gym.Env):
         
     def reset(self, seed: int = None, options = None) -> tuple:
         """
-        Resets the environment.
+        Resets the environment. Games draw from the environment's `np_random`, so passing a
+        seed makes the episodes that follow reproducible.
         """
         super().reset(seed=seed)
-        level = Level(self.level_size, self.n_dims)
-        self.game = Game(level=level)
+        level = self.game.level
+        bank = self.curriculum.bank if self.curriculum is not None else self.level_bank
+        if bank is None:
+            level.reset()
+        else:
+            level.restore(bank.sample(self.np_random))
+        # Cells the snake can fill, counting the start cell.
+        self.n_free_cells = level.n_empty
+        self.game = Game(level=level, rng=self.np_random, backend=self.backend)
+        if self.profiler is not None:
+            self.profiler.instrument_game(self.game)
+        if self.analytics is not None:
+            self.analytics.reset(self.game)
+        self._reset_obs_buffer()
+        self.render_changed_flat = None
         observation = self._get_obs()
         info = self._get_info()
-        self.history.append([])
-        self.episode_counter += 1
+        if self.recorder is not None:
+            self.recorder.end_episode()
+            self.recorder.record(self.game.level.arr)
 
         return observation, info
 
@@ -106,12 +223,18 @@ class Ouroboros(gym.Env):
         """
         Move the snake forward once based on the selected direction. 
         """
-        if self.render_mode == "hydra":
-            self.history[self.episode_counter].append(self.game.level.arr.copy())
-
         direction = self.action_to_direction(action)
         self.game.change_direction(direction)
+        old_head_flat = self.game.head_flat
+        old_tail_flat = self.game.body_ring[self.game.body_start]
         fruit_eaten = self.game.move()
+        if self.analytics is not None:
+            self.analytics.update(old_head_flat, old_tail_flat)
+        self._update_obs_buffer(old_head_flat, old_tail_flat, fruit_eaten)
+        if self.render_changed_flat is not None:
+            self.render_changed_flat.extend(self.game.changed_flat(old_head_flat, old_tail_flat))
+            if len(self.render_changed_flat) > len(self.obs_buffer):
+                self.render_changed_flat = None
         observation = self._get_obs()
 
         if fruit_eaten:
@@ -124,40 +247,45 @@ class Ouroboros(gym.Env):
             reward += 1000
 
         truncated = bool((self.game.timestep - self.game.latest_fruit_timestep) >= self.max_timesteps)
+        if self.curriculum is not None and (terminated or truncated):
+            self.curriculum.record(self.game.body_length / self.n_free_cells)
         info = self._get_info()
+        if self.profiler is not None and (terminated or truncated):
+            info["profile"] = self.profiler.stats()
 
-        if self.render_mode == "hydra" and terminated:
-            self.history[self.episode_counter].append(self.game.level.arr.copy())
+        if self.recorder is not None:
+            self.recorder.record(self.game.level.arr)
         
         return observation, reward, terminated, truncated, info
 
+    def close(self):
+        """
+        Writes the episode being recorded, if any, and closes the render window. A recording
+        to a temporary file is deleted.
+        """
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        if self.renderer is not None:
+            self.renderer.close()
+            self.renderer = None
+
     def render(self):
         """
         Render the current game state.
         """
-        if self.render_mode == "human":
+        if self.render_mode in ("human", "rgb_array"):
             return self._render_frame()
 
     def _render_frame(self):
         """
-        Render one frame from of the current game state.
-        """
-        if self.window is None:
-            pygame.init()
-            pygame.display.init()
-            display_dim_x = self.game.level.arr.shape[0]*self.expansion
-            display_dim_y = self.game.level.arr.shape[1]*self.expansion
-            self.window = pygame.display.set_mode((display_dim_y, display_dim_x))
-            pygame.display.set_caption('Ouroboros')
-        if self.clock is None:
-            self.clock = pygame.time.Clock()
-
-        display_level_arr = self.cell_color_map(self.game.level.arr.transpose())
-        display_level_arr = np.repeat(display_level_arr, self.expansion, axis=0)
-        display_level_arr = np.repeat(display_level_arr, self.expansion, axis=1)
-
-        surf = pygame.surfarray.make_surface(display_level_arr)
-        self.window.blit(surf, (0, 0))
-        pygame.event.pump()
-        pygame.display.update()
-        self.clock.tick(self.metadata["render_fps"])
+        Render one frame from of the current game state. Returns it in "rgb_array" mode.
+        """
+        if self.renderer is None:
+            fps = self.metadata["render_fps"] if self.render_mode == "human" else None
+            self.renderer = make_renderer(self.game.level.shape, self.expansion, self.render_mode, fps)
+        changed_flat = self.render_changed_flat
+        if changed_flat is not None:
+            changed_flat = np.array(changed_flat, dtype=int)
+        self.render_changed_flat = []
+        return self.renderer.render(self.game.level.arr, changed_flat)
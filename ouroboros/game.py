@@ -2,34 +2,54 @@
 N-dimensional snake.
 """
 from collections import deque
-from typing import Optional
+from typing import Optional, Union
 
 import numpy as np
 
 from ouroboros.level import Level
+from ouroboros import kernels
 
 
-class Game:
+class GameSnapshot:
     """
-    Game object.
+    Full state of a FlatGame saved by FlatGame.snapshot(): the level's cells and free-list,
+    the body from tail to head, the scalar game state and the state of the game's RNG.
     """
 
-    def __init__(self, level: Optional[Level] = None, start_position: Optional[tuple] = None,
-                 start_direction: Optional[np.ndarray] = None) -> None:
+    def __init__(self, level_state: tuple, body: list, game_state: tuple, rng_state: dict) -> None:
+        self.level_state = level_state
+        self.body = body
+        self.game_state = game_state
+        self.rng_state = rng_state
+
+
+class FlatGame:
+    """
+    Game object working on the raveled level. Positions are flat indices into `level.flat_arr`
+    and directions are indices into `level.direction_strides`. The body is a preallocated ring
+    buffer of flat indices, so moving the snake doesn't build any tuples or arrays.
+    """
+
+    def __init__(self, level: Optional[Level] = None, start_flat: Optional[int] = None,
+                 start_direction_idx: Optional[int] = None,
+                 rng: Union[int, np.random.Generator, None] = None, backend: str = "python") -> None:
         """
         Game initialization. Snake is randomly initialized with length 1 by default. Provided
-        level should only contain empty cells, walls, and extra fruit. All fruit are replaced 
+        level should only contain empty cells, walls, and extra fruit. All fruit are replaced
         upon being eaten. One fruit will be generated on initialization regardless of provided level.
+        All random draws come from the game's own generator `self.rng`, which is `rng` itself
+        when a Generator is given and is otherwise created from `rng` as a seed.
+        With `backend="numba"`, moves run in a compiled kernel (see ouroboros.kernels).
         """
         if level is None:
             level = Level()
-        if start_position is None:
-            start_position = level.choose_random_empty_position()
-            assert start_position is not None
-        if start_direction is None:
-            start_direction = np.zeros(level.ndim, dtype=int)
-            rand_dim = np.random.randint(level.ndim)
-            start_direction[rand_dim] = np.random.choice([-1, 1])
+        self.rng = np.random.default_rng(rng)
+        if start_flat is None:
+            start_flat = level.choose_random_empty_flat_position(self.rng)
+            assert start_flat is not None
+        if start_direction_idx is None:
+            rand_dim = int(self.rng.integers(level.ndim))
+            start_direction_idx = rand_dim if self.rng.integers(2) == 1 else rand_dim + level.ndim
 
         self.level = level
         self.timestep = 0
@@ -37,75 +57,247 @@ class Game:
         self.latest_fruit_timestep = 0
         self.finished = False
 
-        self.head = start_position
-        self.direction = start_direction
-        self.body = deque()
-        self.add_to_head(self.head, None)
-        self.curr_fruit_pos = None
+        self.head_flat = start_flat
+        self.direction_idx = start_direction_idx
+        self.body_capacity = len(level.flat_arr) + 1
+        self._init_backend(backend)
+        self.body_start = 0
+        self.body_length = 0
+        self.add_to_head_flat(self.head_flat, None)
+        self.curr_fruit_flat = None
         self.spawn_fruit()
 
-    def add_to_head(self, new_pos: tuple, old_pos: Optional[tuple]) -> None:
+    @classmethod
+    def from_body(cls, level: Level, body_flat: list, direction_idx: int = 0,
+                  rng: Union[int, np.random.Generator, None] = None) -> "FlatGame":
+        """
+        Returns a game in progress on a level that already holds the snake and its fruit.
+        `body_flat` lists the flat indices of the snake from tail to head.
+        """
+        game = cls.__new__(cls)
+        game.level = level
+        game.rng = np.random.default_rng(rng)
+        game.timestep = 0
+        game.snake_length = len(body_flat) + 1
+        game.latest_fruit_timestep = 0
+        game.finished = False
+
+        game.head_flat = body_flat[-1]
+        game.direction_idx = direction_idx
+        game.body_capacity = len(level.flat_arr) + 1
+        game._init_backend("python")
+        game.body_ring[:len(body_flat)] = body_flat
+        game.body_start = 0
+        game.body_length = len(body_flat)
+        fruit_flat = np.flatnonzero(level.flat_arr == Level.FRUIT)
+        game.curr_fruit_flat = int(fruit_flat[0]) if len(fruit_flat) > 0 else None
+        return game
+
+    def _init_backend(self, backend: str) -> None:
+        """
+        Allocates the body ring for a backend. The compiled kernel needs it as an array.
+        """
+        self.backend = backend
+        self.move_kernel = kernels.get_move_kernel(backend)
+        if self.move_kernel is None:
+            self.body_ring = [0]*self.body_capacity
+        else:
+            self.body_ring = np.zeros(self.body_capacity, dtype=np.int64)
+            self.direction_strides = np.array(self.level.direction_strides, dtype=np.int64)
+
+    def add_to_head_flat(self, new_flat: int, old_flat: Optional[int]) -> None:
         """
         Add to the snake's body from the head.
         """
-        self.head = new_pos
-        self.body.append(new_pos)
-        self.level[new_pos] = Level.HEAD
-        if old_pos is not None and self.snake_length > 1:
-            self.level[old_pos] = Level.BODY
+        self.head_flat = new_flat
+        self.body_ring[(self.body_start + self.body_length) % self.body_capacity] = new_flat
+        self.body_length += 1
+        self.level.set_flat(new_flat, Level.HEAD)
+        if old_flat is not None and self.snake_length > 1:
+            self.level.set_flat(old_flat, Level.BODY)
         self.snake_length += 1
 
     def remove_from_tail(self) -> None:
         """
         Remove the end of the snake's tail.
         """
-        tail_pos = self.body.popleft()
-        if self.level[tail_pos] == Level.BODY:
-            self.level[tail_pos] = Level.EMPTY
-    
+        tail_flat = self.body_ring[self.body_start]
+        self.body_start = (self.body_start + 1) % self.body_capacity
+        self.body_length -= 1
+        if self.level.flat_arr[tail_flat] == Level.BODY:
+            self.level.set_flat(tail_flat, Level.EMPTY)
+
     def spawn_fruit(self) -> None:
-        fruit_pos = self.level.choose_random_empty_position()
-        self.curr_fruit_pos = fruit_pos
-        if fruit_pos is None:
+        fruit_flat = self.level.choose_random_empty_flat_position(self.rng)
+        self.curr_fruit_flat = fruit_flat
+        if fruit_flat is None:
             self.finished = True
             return
-        self.level[fruit_pos] = Level.FRUIT
+        self.level.set_flat(fruit_flat, Level.FRUIT)
 
     def move(self) -> bool:
         """
         Move the snake by one timestep. Returns True when a fruit is eaten and False otherwise.
         """
+        if self.move_kernel is not None:
+            return self._move_with_kernel()
         self.timestep += 1
-        old_head_pos = self.head
-        new_head_pos = tuple(self.head + self.direction)
+        level = self.level
+        old_head_flat = self.head_flat
+
+        if level.flat_out_of_bounds[self.direction_idx, old_head_flat]:
+            self.finished = True
+            return False
 
-        if self.level.position_out_of_bounds(new_head_pos) or self.level[new_head_pos] == Level.WALL:
+        new_head_flat = old_head_flat + level.direction_strides[self.direction_idx]
+        new_cell = level.flat_arr[new_head_flat]
+        if new_cell == Level.WALL:
             self.finished = True
             return False
 
-        if self.level[new_head_pos] == Level.BODY and new_head_pos != self.body[0]:
+        if new_cell == Level.BODY and new_head_flat != self.body_ring[self.body_start]:
             self.finished = True
             return False
 
-        if self.level[new_head_pos] == Level.FRUIT:
-            self.add_to_head(new_head_pos, old_head_pos)
+        if new_cell == Level.FRUIT:
+            self.add_to_head_flat(new_head_flat, old_head_flat)
             self.spawn_fruit()
             self.latest_fruit_timestep = self.timestep
             return True
         else:
-            self.add_to_head(new_head_pos, old_head_pos)
+            self.add_to_head_flat(new_head_flat, old_head_flat)
             self.remove_from_tail()
             return False
-            
 
-    def change_direction(self, direction: np.ndarray) -> None:
+    def _move_with_kernel(self) -> bool:
         """
-        Change the direction of the snake. Does nothing when trying to go directly backwards.
+        Same as move, with the board and body updates done by the compiled kernel.
+        """
+        self.timestep += 1
+        level = self.level
+        status, self.head_flat, self.body_start, self.body_length, level.n_empty = self.move_kernel(
+            level.flat_arr, level.empty_flat_positions, level.empty_slots, level.n_empty,
+            self.body_ring, self.body_start, self.body_length, self.head_flat, self.direction_idx,
+            level.flat_out_of_bounds, self.direction_strides)
+
+        if status == kernels.MOVE_FINISHED:
+            self.finished = True
+            return False
+        self.snake_length += 1
+        if status == kernels.MOVE_ATE_FRUIT:
+            self.spawn_fruit()
+            self.latest_fruit_timestep = self.timestep
+            return True
+        return False
+
+    def body_flat(self) -> list:
+        """
+        Returns the flat indices of the snake's body, ordered from tail to head.
+        """
+        return [self.body_ring[(self.body_start + i) % self.body_capacity]
+                for i in range(self.body_length)]
+
+    def changed_flat(self, old_head_flat: int, old_tail_flat: int) -> list:
+        """
+        Returns the flat indices of the cells a move can have changed, given where the head and
+        tail were before it: the old head and tail, the new head and the fruit.
+        """
+        changed = [old_head_flat, old_tail_flat, self.head_flat]
+        if self.curr_fruit_flat is not None:
+            changed.append(self.curr_fruit_flat)
+        return changed
+
+    def snapshot(self) -> GameSnapshot:
         """
-        self.direction = direction
-    
+        Returns a copy of the full game state that restore() can go back to. Costs a copy of
+        the level arrays and of the body, so it can be used for lookahead and checkpoints.
+        """
+        end = self.body_start + self.body_length
+        if end <= self.body_capacity:
+            body = list(self.body_ring[self.body_start:end])
+        else:
+            body = list(self.body_ring[self.body_start:]) + list(self.body_ring[:end - self.body_capacity])
+        game_state = (self.timestep, self.snake_length, self.latest_fruit_timestep, self.finished,
+                      self.head_flat, self.direction_idx, self.curr_fruit_flat)
+        return GameSnapshot(self.level.snapshot(), body, game_state, self.rng.bit_generator.state)
+
+    def restore(self, snapshot: GameSnapshot) -> None:
+        """
+        Restore a state returned by snapshot() in place. The level must have the same shape.
+        """
+        self.level.restore(snapshot.level_state)
+        self.body_ring[:len(snapshot.body)] = snapshot.body
+        self.body_start = 0
+        self.body_length = len(snapshot.body)
+        (self.timestep, self.snake_length, self.latest_fruit_timestep, self.finished,
+         self.head_flat, self.direction_idx, self.curr_fruit_flat) = snapshot.game_state
+        self.rng.bit_generator.state = snapshot.rng_state
+
+    def change_direction_idx(self, direction_idx: int) -> None:
+        """
+        Change the direction of the snake given a direction index.
+        """
+        self.direction_idx = direction_idx
+
     def won(self):
         """
         Returns True if game has been won.
         """
-        return self.finished and len(self.level.empty_cell_positions) == 0
+        return self.finished and self.level.n_empty == 0
+
+
+class Game(FlatGame):
+    """
+    Game object. Tuple-based view over FlatGame: positions are index tuples and directions
+    are unit vectors.
+    """
+
+    def __init__(self, level: Optional[Level] = None, start_position: Optional[tuple] = None,
+                 start_direction: Optional[np.ndarray] = None,
+                 rng: Union[int, np.random.Generator, None] = None, backend: str = "python") -> None:
+        """
+        Game initialization. Snake is randomly initialized with length 1 by default. Provided
+        level should only contain empty cells, walls, and extra fruit. All fruit are replaced
+        upon being eaten. One fruit will be generated on initialization regardless of provided level.
+        """
+        if level is None:
+            level = Level()
+        start_flat = None
+        if start_position is not None:
+            start_flat = level.flat_index(start_position)
+        start_direction_idx = None
+        if start_direction is not None:
+            start_direction_idx = level.direction_index(start_direction)
+
+        super().__init__(level, start_flat, start_direction_idx, rng, backend)
+
+    @property
+    def head(self) -> tuple:
+        return self.level.position(self.head_flat)
+
+    @property
+    def direction(self) -> np.ndarray:
+        return self.level.direction_vector(self.direction_idx)
+
+    @property
+    def body(self) -> deque:
+        return deque(self.level.position(flat_idx) for flat_idx in self.body_flat())
+
+    @property
+    def curr_fruit_pos(self) -> Optional[tuple]:
+        if self.curr_fruit_flat is None:
+            return None
+        return self.level.position(self.curr_fruit_flat)
+
+    def add_to_head(self, new_pos: tuple, old_pos: Optional[tuple]) -> None:
+        """
+        Add to the snake's body from the head.
+        """
+        old_flat = None if old_pos is None else self.level.flat_index(old_pos)
+        self.add_to_head_flat(self.level.flat_index(new_pos), old_flat)
+
+    def change_direction(self, direction: np.ndarray) -> None:
+        """
+        Change the direction of the snake. Does nothing when trying to go directly backwards.
+        """
+        self.change_direction_idx(self.level.direction_index(direction))
@@ -0,0 +1,215 @@
+"""
+Procedural level layouts and banks of precomputed level templates.
+
+Layouts are arrays of empty cells and walls. A layout can be generated for a smaller region and
+embedded in a larger level, with every cell outside of the region being a wall, so levels of
+different sizes and numbers of dimensions can share one observation space.
+"""
+from collections import deque
+from typing import Optional, Union
+
+import numpy as np
+
+from ouroboros.level import Level
+
+LAYOUTS = ["empty", "border", "obstacles", "maze"]
+
+
+def empty_layout(shape: tuple, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    return np.full(shape, Level.EMPTY)
+
+
+def border_layout(shape: tuple, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    Returns a layout whose outer cells are walls.
+    """
+    arr = np.full(shape, Level.WALL)
+    arr[tuple(slice(1, -1) for _ in shape)] = Level.EMPTY
+    return arr
+
+
+def largest_empty_component(arr: np.ndarray) -> np.ndarray:
+    """
+    Returns a copy of a layout where the empty cells that aren't connected to the largest
+    group of connected empty cells are turned into walls.
+    """
+    level = Level(arr=arr)
+    flat_arr = level.flat_arr
+    labels = np.full(len(flat_arr), -1)
+    sizes = []
+    for start in np.flatnonzero(flat_arr == Level.EMPTY):
+        if labels[start] != -1:
+            continue
+        label = len(sizes)
+        labels[start] = label
+        size = 0
+        queue = deque([start])
+        while queue:
+            flat_idx = queue.popleft()
+            size += 1
+            for direction_idx, stride in enumerate(level.direction_strides):
+                if level.flat_out_of_bounds[direction_idx, flat_idx]:
+                    continue
+                next_flat = flat_idx + stride
+                if flat_arr[next_flat] == Level.EMPTY and labels[next_flat] == -1:
+                    labels[next_flat] = label
+                    queue.append(next_flat)
+        sizes.append(size)
+
+    result = arr.copy()
+    if sizes:
+        result.reshape(-1)[(labels != -1) & (labels != int(np.argmax(sizes)))] = Level.WALL
+    return result
+
+
+def obstacle_layout(shape: tuple, rng: np.random.Generator, density: float = 0.1) -> np.ndarray:
+    """
+    Returns a layout with `density` of the cells turned into walls at random. Empty cells cut
+    off from the largest open area are filled in, so every empty cell can be reached.
+    """
+    arr = np.full(shape, Level.EMPTY)
+    arr[rng.random(shape) < density] = Level.WALL
+    return largest_empty_component(arr)
+
+
+def maze_layout(shape: tuple, rng: np.random.Generator, braid: float = 0.3) -> np.ndarray:
+    """
+    Returns an N-d maze carved by a randomized depth-first search. Maze cells are the cells
+    with only even coordinates, and the walls between them are knocked down as the search goes.
+    A `braid` fraction of the remaining inner walls is removed afterwards to create loops,
+    since dead ends are deadly for long snakes.
+    """
+    ndim = len(shape)
+    cell_shape = tuple((size + 1) // 2 for size in shape)
+    arr = np.full(shape, Level.WALL)
+    visited = np.zeros(cell_shape, dtype=bool)
+    steps = [np.eye(ndim, dtype=int)[axis]*sign for axis in range(ndim) for sign in (1, -1)]
+
+    start = np.array([rng.integers(size) for size in cell_shape])
+    visited[tuple(start)] = True
+    arr[tuple(2*start)] = Level.EMPTY
+    stack = [start]
+    while stack:
+        cell = stack[-1]
+        neighbors = []
+        for step in steps:
+            neighbor = cell + step
+            if np.all(neighbor >= 0) and np.all(neighbor < cell_shape) and not visited[tuple(neighbor)]:
+                neighbors.append(neighbor)
+        if not neighbors:
+            stack.pop()
+            continue
+        neighbor = neighbors[rng.integers(len(neighbors))]
+        visited[tuple(neighbor)] = True
+        arr[tuple(2*cell + (neighbor - cell))] = Level.EMPTY
+        arr[tuple(2*neighbor)] = Level.EMPTY
+        stack.append(neighbor)
+
+    # Walls between two maze cells have exactly one odd coordinate.
+    coords = np.indices(shape).reshape(ndim, -1)
+    odd = coords % 2 == 1
+    between = (odd.sum(axis=0) == 1) & np.all(coords < np.array(shape).reshape(ndim, 1) - odd, axis=0)
+    inner_walls = np.flatnonzero(between & (arr.reshape(-1) == Level.WALL))
+    n_removed = int(braid*len(inner_walls))
+    arr.reshape(-1)[rng.choice(inner_walls, size=n_removed, replace=False)] = Level.EMPTY
+    return arr
+
+
+LAYOUT_FUNCTIONS = {
+    "empty": empty_layout,
+    "border": border_layout,
+    "obstacles": obstacle_layout,
+    "maze": maze_layout,
+}
+
+
+def embed_layout(layout: np.ndarray, shape: tuple) -> np.ndarray:
+    """
+    Returns a level of the given shape holding the layout in its corner, with walls everywhere
+    else. A layout with fewer dimensions is put in the slice where the extra coordinates are 0.
+    """
+    assert layout.ndim <= len(shape)
+    arr = np.full(shape, Level.WALL)
+    index = tuple(slice(0, size) for size in layout.shape) + (0,)*(len(shape) - layout.ndim)
+    arr[index] = layout
+    return arr
+
+
+def generate_layout(kind: str, shape: tuple, rng: Union[int, np.random.Generator, None] = None,
+                    region: Optional[tuple] = None, **kwargs) -> np.ndarray:
+    """
+    Returns a layout of the given kind (see LAYOUTS). When `region` is given, the layout is
+    generated with the region's shape and embedded in a level of the given shape.
+    """
+    rng = np.random.default_rng(rng)
+    if region is None:
+        region = shape
+    layout = LAYOUT_FUNCTIONS[kind](tuple(region), rng, **kwargs)
+    return embed_layout(layout, shape)
+
+
+class LevelBank:
+    """
+    Bank of level templates of one shape along with their precomputed free-lists of empty
+    cells. A template is in the format of Level.snapshot(), so resetting a level to it with
+    Level.restore only copies arrays. Banks are saved to and loaded from .npz files.
+    """
+
+    def __init__(self, levels: np.ndarray) -> None:
+        """
+        Builds a bank from an array of shape (n_levels, *level_shape).
+        """
+        self.levels = levels.astype(np.int8)
+        self.shape = levels.shape[1:]
+        n_levels = len(levels)
+        n_cells = int(np.prod(self.shape))
+        flat_levels = self.levels.reshape(n_levels, n_cells)
+
+        self.empty_flat_positions = np.zeros((n_levels, n_cells), dtype=np.int32)
+        self.empty_slots = np.full((n_levels, n_cells), -1, dtype=np.int32)
+        self.n_empty = np.zeros(n_levels, dtype=int)
+        for i, flat_level in enumerate(flat_levels):
+            empty_flat_indices = np.flatnonzero(flat_level == Level.EMPTY)
+            self.n_empty[i] = len(empty_flat_indices)
+            self.empty_flat_positions[i, :len(empty_flat_indices)] = empty_flat_indices
+            self.empty_slots[i, empty_flat_indices] = np.arange(len(empty_flat_indices))
+        assert np.all(self.n_empty >= 2), "every level needs room for a snake and a fruit"
+
+    @classmethod
+    def generate(cls, n_levels: int, kind: str, shape: tuple, seed: Optional[int] = None,
+                 region: Optional[tuple] = None, **kwargs) -> "LevelBank":
+        """
+        Generates a bank of `n_levels` seeded layouts (see generate_layout).
+        """
+        rng = np.random.default_rng(seed)
+        return cls(np.stack([generate_layout(kind, shape, rng, region, **kwargs) for _ in range(n_levels)]))
+
+    @classmethod
+    def load(cls, path: str) -> "LevelBank":
+        with np.load(path) as data:
+            bank = cls.__new__(cls)
+            bank.levels = data["levels"]
+            bank.empty_flat_positions = data["empty_flat_positions"]
+            bank.empty_slots = data["empty_slots"]
+            bank.n_empty = data["n_empty"]
+        bank.shape = bank.levels.shape[1:]
+        return bank
+
+    def save(self, path: str) -> None:
+        np.savez(path, levels=self.levels, empty_flat_positions=self.empty_flat_positions,
+                 empty_slots=self.empty_slots, n_empty=self.n_empty)
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def template(self, i: int) -> tuple:
+        """
+        Returns template i in the format of Level.snapshot().
+        """
+        return self.levels[i], self.empty_flat_positions[i], self.empty_slots[i], int(self.n_empty[i])
+
+    def sample(self, rng: np.random.Generator) -> tuple:
+        """
+        Returns a random template.
+        """
+        return self.template(rng.integers(len(self)))
@@ -0,0 +1,94 @@
+"""
+Compiled kernels for the game's inner loop. The kernels work on the level's plain integer arrays
+and are compiled with Numba when it's installed. Without Numba, the same functions run as
+pure Python.
+"""
+import warnings
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+from ouroboros.level import Level
+
+BACKENDS = ["python", "numba"]
+
+MOVE_FINISHED = 0
+MOVE_PLAIN = 1
+MOVE_ATE_FRUIT = 2
+
+WALL = Level.WALL
+FRUIT = Level.FRUIT
+EMPTY = Level.EMPTY
+HEAD = Level.HEAD
+BODY = Level.BODY
+
+
+def move_kernel(flat_arr, empty_flat_positions, empty_slots, n_empty, body_ring, body_start,
+                body_length, head_flat, direction_idx, flat_out_of_bounds, direction_strides):
+    """
+    Moves the snake by one cell with the semantics of FlatGame.move, except that no fruit is
+    spawned. Updates the level and the body ring in place and returns
+    (status, head_flat, body_start, body_length, n_empty), where status is MOVE_FINISHED,
+    MOVE_PLAIN or MOVE_ATE_FRUIT.
+    """
+    if flat_out_of_bounds[direction_idx, head_flat]:
+        return MOVE_FINISHED, head_flat, body_start, body_length, n_empty
+
+    body_capacity = len(body_ring)
+    new_head_flat = head_flat + direction_strides[direction_idx]
+    new_cell = flat_arr[new_head_flat]
+    if new_cell == WALL:
+        return MOVE_FINISHED, head_flat, body_start, body_length, n_empty
+    if new_cell == BODY and new_head_flat != body_ring[body_start]:
+        return MOVE_FINISHED, head_flat, body_start, body_length, n_empty
+
+    # Adding the new head and removing it from the free-list.
+    body_ring[(body_start + body_length) % body_capacity] = new_head_flat
+    body_length += 1
+    if new_cell == EMPTY:
+        slot = empty_slots[new_head_flat]
+        last_flat_idx = empty_flat_positions[n_empty - 1]
+        empty_flat_positions[slot] = last_flat_idx
+        empty_slots[last_flat_idx] = slot
+        empty_slots[new_head_flat] = -1
+        n_empty -= 1
+    flat_arr[new_head_flat] = HEAD
+    flat_arr[head_flat] = BODY
+
+    if new_cell == FRUIT:
+        return MOVE_ATE_FRUIT, new_head_flat, body_start, body_length, n_empty
+
+    # Removing the tail and adding it back to the free-list.
+    tail_flat = body_ring[body_start]
+    body_start = (body_start + 1) % body_capacity
+    body_length -= 1
+    if flat_arr[tail_flat] == BODY:
+        flat_arr[tail_flat] = EMPTY
+        empty_flat_positions[n_empty] = tail_flat
+        empty_slots[tail_flat] = n_empty
+        n_empty += 1
+
+    return MOVE_PLAIN, new_head_flat, body_start, body_length, n_empty
+
+
+if numba is not None:
+    jit_move_kernel = numba.njit(cache=True)(move_kernel)
+else:
+    jit_move_kernel = None
+
+
+def get_move_kernel(backend: str):
+    """
+    Returns the move kernel of a backend: None for the reference "python" implementation
+    in FlatGame, and the compiled kernel for "numba" (the kernel as pure Python when Numba
+    isn't installed).
+    """
+    assert backend in BACKENDS
+    if backend == "python":
+        return None
+    if jit_move_kernel is None:
+        warnings.warn("Numba is not installed, running the move kernel as pure Python")
+        return move_kernel
+    return jit_move_kernel
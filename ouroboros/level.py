@@ -26,19 +26,81 @@ class Level:
             level_shape = (level_size,)*n_dims
             self.arr = np.full(shape=level_shape, fill_value=Level.EMPTY)
         else:
-            self.arr = arr
+            self.arr = np.ascontiguousarray(arr)
 
         self.shape = self.arr.shape
         self.ndim = self.arr.ndim
         
-        # Gathering initial empty cells. __setitem__ keeps track of them afterwards.
-        self.empty_cell_positions = set()
-        flat_length = np.prod(self.arr.shape)
-        for flat_i in range(flat_length):
-            pos = np.unravel_index(flat_i, shape=self.arr.shape)
-            if self.arr[pos] == Level.EMPTY:
-                self.empty_cell_positions.add(pos)
+        # Raveled view of the level used by FlatGame. Positions in it are flat indices.
+        self.flat_arr = self.arr.reshape(-1)
+        flat_length = len(self.flat_arr)
+        self.strides = tuple(int(np.prod(self.shape[i+1:])) for i in range(self.ndim))
+
+        # Directions are indexed like the environment's actions: index i < ndim moves by +1
+        # along axis i and index i + ndim moves by -1 along axis i. flat_out_of_bounds[d, i]
+        # is True when moving from flat index i in direction d leaves the level.
+        self.direction_strides = self.strides + tuple(-stride for stride in self.strides)
+        coords = np.indices(self.shape).reshape(self.ndim, flat_length)
+        upper_bounds = np.array(self.shape).reshape(self.ndim, 1) - 1
+        self.flat_out_of_bounds = np.concatenate([coords == upper_bounds, coords == 0])
+
+        # Gathering initial empty cells. __setitem__ keeps track of them afterwards in a
+        # free-list: the first n_empty entries of empty_flat_positions are the flat indices
+        # of the empty cells and empty_slots maps a flat index to its entry (-1 if not empty).
+        empty_flat_indices = np.flatnonzero(self.arr == Level.EMPTY)
+        self.n_empty = len(empty_flat_indices)
+        self.empty_flat_positions = np.zeros(flat_length, dtype=int)
+        self.empty_flat_positions[:self.n_empty] = empty_flat_indices
+        self.empty_slots = np.full(flat_length, -1)
+        self.empty_slots[empty_flat_indices] = np.arange(self.n_empty)
+
+        # Initial state is cached so that reset() only has to copy it back.
+        self.template_arr = self.arr.copy()
+        self.template_empty_flat_positions = self.empty_flat_positions.copy()
+        self.template_empty_slots = self.empty_slots.copy()
+        self.template_n_empty = self.n_empty
+
+
+    def __getstate__(self) -> dict:
+        """
+        Returns the state to pickle, without flat_arr: pickling would copy it apart from arr, so
+        __setstate__ rebuilds it as a view.
+        """
+        state = self.__dict__.copy()
+        del state["flat_arr"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        """
+        Restores a pickled level, with flat_arr as a view of arr.
+        """
+        self.__dict__.update(state)
+        self.flat_arr = self.arr.reshape(-1)
+
+    def reset(self) -> None:
+        """
+        Restore the level to its initial state by copying the cached template arrays.
+        """
+        np.copyto(self.arr, self.template_arr)
+        np.copyto(self.empty_flat_positions, self.template_empty_flat_positions)
+        np.copyto(self.empty_slots, self.template_empty_slots)
+        self.n_empty = self.template_n_empty
+
+    def snapshot(self) -> tuple:
+        """
+        Returns copies of the cells and of the free-list of empty cells.
+        """
+        return self.arr.copy(), self.empty_flat_positions.copy(), self.empty_slots.copy(), self.n_empty
 
+    def restore(self, snapshot: tuple) -> None:
+        """
+        Restore a state returned by snapshot() in place.
+        """
+        arr, empty_flat_positions, empty_slots, n_empty = snapshot
+        np.copyto(self.arr, arr)
+        np.copyto(self.empty_flat_positions, empty_flat_positions)
+        np.copyto(self.empty_slots, empty_slots)
+        self.n_empty = n_empty
 
     def __getitem__(self, key):
         """
@@ -46,15 +108,112 @@ class Level:
         """
         return self.arr.__getitem__(key)
 
-    def __setitem__(self, key, value) -> None:
+    def __setitem__(self, key: tuple, value) -> None:
         """
-        Set an item in self.arr. Keeps track of empty cells.
+        Set an item in self.arr. Keeps track of empty cells. `key` must index a single cell.
         """
-        if self.arr[key] == Level.EMPTY and value != Level.EMPTY:
-            self.empty_cell_positions.remove(key)
-        if self.arr[key] != Level.EMPTY and value == Level.EMPTY:
-            self.empty_cell_positions.add(key)
-        return self.arr.__setitem__(key, value)
+        self.set_flat(self.flat_index(key), value)
+
+    def set_flat(self, flat_idx: int, value) -> None:
+        """
+        Set the cell at a flat index. Keeps track of empty cells.
+        """
+        if self.flat_arr[flat_idx] == Level.EMPTY:
+            if value != Level.EMPTY:
+                self._remove_empty(flat_idx)
+        elif value == Level.EMPTY:
+            self._add_empty(flat_idx)
+        self.flat_arr[flat_idx] = value
+
+    def set_flat_many(self, flat_indices: np.ndarray, value) -> None:
+        """
+        Set the cells at distinct flat indices to the same value with vectorized operations.
+        Keeps track of empty cells.
+        """
+        flat_indices = np.asarray(flat_indices, dtype=int)
+        was_empty = self.flat_arr[flat_indices] == Level.EMPTY
+        if value == Level.EMPTY:
+            self._add_empty_many(flat_indices[~was_empty])
+        else:
+            self._remove_empty_many(flat_indices[was_empty])
+        self.flat_arr[flat_indices] = value
+
+    def flat_index(self, pos: tuple) -> int:
+        """
+        Returns the row-major flat index of a position.
+        """
+        return sum(int(p)*stride for p, stride in zip(pos, self.strides))
+
+    def position(self, flat_idx: int) -> tuple:
+        """
+        Returns the position of a flat index.
+        """
+        return np.unravel_index(flat_idx, shape=self.shape)
+
+    def direction_index(self, direction: np.ndarray) -> int:
+        """
+        Returns the index of a unit direction vector in self.direction_strides.
+        """
+        axis = int(np.flatnonzero(direction)[0])
+        if direction[axis] < 0:
+            return axis + self.ndim
+        return axis
+
+    def direction_vector(self, direction_idx: int) -> np.ndarray:
+        """
+        Returns the unit direction vector of a direction index.
+        """
+        direction = np.zeros(self.ndim, dtype=int)
+        direction[direction_idx % self.ndim] = 1
+        if direction_idx >= self.ndim:
+            direction *= -1
+
+        return direction
+
+    def _add_empty(self, flat_idx: int) -> None:
+        """
+        Append a cell to the free-list of empty cells.
+        """
+        self.empty_flat_positions[self.n_empty] = flat_idx
+        self.empty_slots[flat_idx] = self.n_empty
+        self.n_empty += 1
+
+    def _remove_empty(self, flat_idx: int) -> None:
+        """
+        Remove a cell from the free-list of empty cells by moving the last entry into its slot.
+        """
+        slot = self.empty_slots[flat_idx]
+        last_flat_idx = self.empty_flat_positions[self.n_empty-1]
+        self.empty_flat_positions[slot] = last_flat_idx
+        self.empty_slots[last_flat_idx] = slot
+        self.empty_slots[flat_idx] = -1
+        self.n_empty -= 1
+
+    def _add_empty_many(self, flat_indices: np.ndarray) -> None:
+        """
+        Append distinct cells to the free-list of empty cells.
+        """
+        n_empty = self.n_empty + len(flat_indices)
+        self.empty_flat_positions[self.n_empty:n_empty] = flat_indices
+        self.empty_slots[flat_indices] = np.arange(self.n_empty, n_empty)
+        self.n_empty = n_empty
+
+    def _remove_empty_many(self, flat_indices: np.ndarray) -> None:
+        """
+        Remove distinct cells from the free-list of empty cells. The holes they leave before
+        the new end of the list are filled with the remaining entries past it.
+        """
+        if len(flat_indices) == 0:
+            return
+        n_empty = self.n_empty - len(flat_indices)
+        slots = self.empty_slots[flat_indices]
+        self.empty_slots[flat_indices] = -1
+        past_end = self.empty_flat_positions[n_empty:self.n_empty]
+        kept = past_end[self.empty_slots[past_end] != -1]
+        holes = slots[slots < n_empty]
+        self.empty_flat_positions[holes] = kept
+        self.empty_slots[kept] = holes
+        self.n_empty = n_empty
 
     def position_out_of_bounds(self, pos: tuple):
         """
@@ -68,21 +227,14 @@ class Level:
     def _choose_random_empty_position_iter(self) -> Optional[tuple]:
         """
         Choose a random empty cell in a level. Returns a tuple representing an index or none when.
-        no empty cells are remaining. Implemented using iterative method. Should be used if level 
-        doesn't have many empty cells remaining.
+        no empty cells are remaining. Implemented by scanning the whole level at once. Should be used
+        if level doesn't have many empty cells remaining.
         """
-        flat_length = np.prod(self.arr.shape)
-        empty_cell_positions = []
-
-        for flat_i in range(flat_length):
-            pos = np.unravel_index(flat_i, shape=self.arr.shape)
-            if self.arr[pos] == Level.EMPTY:
-                empty_cell_positions.append(pos)
-
-        if len(empty_cell_positions) == 0:
+        empty_flat_indices = np.flatnonzero(self.arr == Level.EMPTY)
+        if len(empty_flat_indices) == 0:
             return None
-        random_pos_idx = np.random.randint(len(empty_cell_positions))
-        random_pos = empty_cell_positions[random_pos_idx]
+        random_flat_idx = empty_flat_indices[np.random.randint(len(empty_flat_indices))]
+        random_pos = np.unravel_index(random_flat_idx, shape=self.arr.shape)
 
         return random_pos
     
@@ -99,16 +251,26 @@ class Level:
             if self.arr[random_pos] == Level.EMPTY:
                 return random_pos
     
-    def choose_random_empty_position(self) -> Optional[tuple]:
+    def choose_random_empty_flat_position(self, rng: Optional[np.random.Generator] = None) -> Optional[int]:
+        """
+        Choose a random empty cell in a level. Returns its flat index or None when no empty
+        cells are left. Runs in constant time by sampling an entry of the free-list of empty
+        cells. Draws from `rng`, or from the global np.random state when rng is None.
+        """
+        if self.n_empty == 0:
+            return None
+        if rng is None:
+            return int(self.empty_flat_positions[np.random.randint(self.n_empty)])
+        return int(self.empty_flat_positions[rng.integers(self.n_empty)])
+
+    def choose_random_empty_position(self, rng: Optional[np.random.Generator] = None) -> Optional[tuple]:
         """
         Choose a random empty cell in a level. Returns a tuple representing an index or
         None when no empty cells are left.
         """
-        empty_cell_positions_list = list(self.empty_cell_positions)
-        if len(empty_cell_positions_list) == 0:
+        random_flat_idx = self.choose_random_empty_flat_position(rng)
+        if random_flat_idx is None:
             return None
-        random_pos_idx = np.random.randint(len(empty_cell_positions_list))
-        random_pos = empty_cell_positions_list[random_pos_idx]
+        random_pos = self.position(random_flat_idx)
 
         return random_pos
-
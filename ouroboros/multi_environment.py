@@ -0,0 +1,120 @@
+"""
+Defining a PettingZoo-style parallel environment for competitive multi-snake Ouroboros.
+"""
+from typing import Optional
+
+import numpy as np
+import gymnasium as gym
+
+try:
+    from pettingzoo import ParallelEnv
+except ImportError:
+    ParallelEnv = object
+
+from ouroboros.level import Level
+from ouroboros.multi_game import MultiGame
+
+
+class MultiOuroboros(ParallelEnv):
+    """
+    Parallel multi-agent environment where every agent controls one snake of a MultiGame.
+    Follows the PettingZoo ParallelEnv API, and subclasses ParallelEnv when PettingZoo is
+    installed.
+    """
+
+    metadata = {"name": "ouroboros_multi_v0", "render_modes": []}
+
+    def __init__(self, level_size: int, n_dims: int, n_snakes: int = 2, n_fruits: int = 1,
+                 max_timesteps: Optional[int] = None) -> None:
+        """
+        Environment initialization. Every agent observes the whole level as a flat array where
+        its own snake is HEAD and BODY and the other snakes are MultiGame.OTHER_HEAD and
+        MultiGame.OTHER_BODY. Actions follow the `Ouroboros` environment. Agents get a reward
+        of 1 per fruit, are terminated when their snake dies and truncated when their snake
+        doesn't eat for `max_timesteps` timesteps, which removes it from the level.
+        """
+        self.level_size = level_size
+        self.n_dims = n_dims
+        self.n_snakes = n_snakes
+        self.n_fruits = n_fruits
+        self.render_mode = None
+
+        self.level = Level(level_size, n_dims)
+        flat_length = len(self.level.flat_arr)
+        if max_timesteps is None:
+            self.max_timesteps = flat_length*4
+        else:
+            self.max_timesteps = max_timesteps
+
+        self.possible_agents = [f"snake_{k}" for k in range(n_snakes)]
+        self.agent_ids = {agent: k for k, agent in enumerate(self.possible_agents)}
+        self.agents = []
+        self.observation_spaces = {agent: gym.spaces.Box(Level.WALL, MultiGame.OTHER_BODY, shape=(flat_length,), dtype=int)
+                                   for agent in self.possible_agents}
+        self.action_spaces = {agent: gym.spaces.Discrete(n_dims*2) for agent in self.possible_agents}
+
+        self.rng = np.random.default_rng()
+        self.game = None
+
+    def observation_space(self, agent: str) -> gym.Space:
+        return self.observation_spaces[agent]
+
+    def action_space(self, agent: str) -> gym.Space:
+        return self.action_spaces[agent]
+
+    def _get_obs(self) -> dict:
+        """
+        Returns the observations of the current agents.
+        """
+        observations = self.game.observations()
+        return {agent: observations[self.agent_ids[agent]] for agent in self.agents}
+
+    def _get_infos(self) -> dict:
+        """
+        Returns auxiliary information of the current agents.
+        """
+        return {agent: {'snake_length': int(self.game.body_length[self.agent_ids[agent]])}
+                for agent in self.agents}
+
+    def reset(self, seed: Optional[int] = None, options = None) -> tuple:
+        """
+        Resets the environment. Passing a seed makes the episodes that follow reproducible.
+        """
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self.level.reset()
+        self.game = MultiGame(self.level, self.n_snakes, self.n_fruits, self.rng)
+        self.agents = list(self.possible_agents)
+        return self._get_obs(), self._get_infos()
+
+    def step(self, actions: dict) -> tuple:
+        """
+        Moves every snake at once. Snakes of agents without an action keep their direction.
+        """
+        game = self.game
+        direction_idx = game.direction_idx.copy()
+        for agent, action in actions.items():
+            direction_idx[self.agent_ids[agent]] = action
+        game.change_direction_idx(direction_idx)
+        fruit_eaten = game.move()
+
+        truncated = game.alive & (game.timestep - game.latest_fruit_timestep >= self.max_timesteps)
+        game.remove_snakes(np.flatnonzero(truncated))
+
+        observations = self._get_obs()
+        rewards, terminations, truncations = {}, {}, {}
+        for agent in self.agents:
+            k = self.agent_ids[agent]
+            rewards[agent] = int(fruit_eaten[k])
+            truncations[agent] = bool(truncated[k])
+            terminations[agent] = not game.alive[k] and not truncated[k]
+        infos = self._get_infos()
+        self.agents = [agent for agent in self.agents if game.alive[self.agent_ids[agent]]]
+
+        return observations, rewards, terminations, truncations, infos
+
+    def render(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,190 @@
+"""
+N-dimensional snake with several competing snakes on one level.
+"""
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+from ouroboros.level import Level
+
+
+class MultiGame:
+    """
+    Game with `n_snakes` snakes sharing one level. The level holds HEAD and BODY cells for
+    every snake and `owners` maps each cell to the snake occupying it (-1 if none). Per-snake
+    state is kept in arrays indexed by snake, and moves are resolved for all snakes at once
+    with vectorized operations, so the cost of a step barely depends on the number of snakes.
+    All snakes move simultaneously. A snake dies when it leaves the level, or moves into a
+    wall or into a body cell that isn't a tail leaving on this move (tails of snakes that eat
+    stay). Snakes moving into the same cell, or swapping cells, all die. Dead snakes are
+    removed from the level. `n_fruits` fruits are on the level, and every eaten fruit is
+    replaced.
+    """
+    OTHER_HEAD = Level.BODY + 1
+    OTHER_BODY = Level.BODY + 2
+
+    def __init__(self, level: Optional[Level] = None, n_snakes: int = 2, n_fruits: int = 1,
+                 rng: Union[int, np.random.Generator, None] = None) -> None:
+        """
+        Game initialization. Snakes start with length 1 in random empty cells, facing random
+        directions. Provided level should only contain empty cells and walls.
+        """
+        if level is None:
+            level = Level()
+        self.level = level
+        self.n_snakes = n_snakes
+        self.rng = np.random.default_rng(rng)
+        n_cells = len(level.flat_arr)
+        self.rows = np.arange(n_snakes)
+        self.direction_strides = np.array(level.direction_strides)
+
+        self.owners = np.full(n_cells, -1)
+        # Per-cell scratch arrays for resolving moves without sorting. They are cleared after use.
+        self.cell_flags = np.zeros(n_cells, dtype=bool)
+        self.cell_claims = np.zeros(n_cells, dtype=int)
+        # The body of snake k is a ring buffer holding flat indices from tail to head.
+        self.body_capacity = n_cells + 1
+        self.body_ring = np.zeros((n_snakes, self.body_capacity), dtype=int)
+        self.body_start = np.zeros(n_snakes, dtype=int)
+        self.body_length = np.zeros(n_snakes, dtype=int)
+        self.head_flat = np.zeros(n_snakes, dtype=int)
+        self.direction_idx = np.zeros(n_snakes, dtype=int)
+        self.alive = np.zeros(n_snakes, dtype=bool)
+
+        self.timestep = 0
+        self.latest_fruit_timestep = np.zeros(n_snakes, dtype=int)
+
+        for k in range(n_snakes):
+            start_flat = level.choose_random_empty_flat_position(self.rng)
+            assert start_flat is not None, "the level has no room for every snake"
+            level.set_flat(start_flat, Level.HEAD)
+            self.owners[start_flat] = k
+            self.head_flat[k] = start_flat
+            self.body_ring[k, 0] = start_flat
+            self.body_length[k] = 1
+            self.direction_idx[k] = self.rng.integers(2*level.ndim)
+            self.alive[k] = True
+        for _ in range(n_fruits):
+            self.spawn_fruit()
+
+    @property
+    def finished(self) -> bool:
+        return not self.alive.any()
+
+    def spawn_fruit(self) -> None:
+        """
+        Spawn a fruit in a random empty cell, if there is any left.
+        """
+        fruit_flat = self.level.choose_random_empty_flat_position(self.rng)
+        if fruit_flat is not None:
+            self.level.set_flat(fruit_flat, Level.FRUIT)
+
+    def change_direction_idx(self, direction_indices: np.ndarray) -> None:
+        """
+        Change the direction of every snake. Directions of dead snakes are ignored.
+        """
+        self.direction_idx[:] = direction_indices
+
+    def move(self) -> np.ndarray:
+        """
+        Move every living snake by one timestep. Returns a boolean array that is True for
+        snakes that ate a fruit.
+        """
+        level = self.level
+        flat_arr = level.flat_arr
+        self.timestep += 1
+        fruit_eaten = np.zeros(self.n_snakes, dtype=bool)
+        ids = np.flatnonzero(self.alive)
+        if len(ids) == 0:
+            return fruit_eaten
+
+        head_flat = self.head_flat[ids]
+        direction_idx = self.direction_idx[ids]
+        out_of_bounds = level.flat_out_of_bounds[direction_idx, head_flat]
+        target_flat = np.where(out_of_bounds, head_flat, head_flat + self.direction_strides[direction_idx])
+        target_cells = flat_arr[target_flat]
+        eats = ~out_of_bounds & (target_cells == Level.FRUIT)
+        tail_flat = self.body_ring[ids, self.body_start[ids]]
+
+        cell_flags = self.cell_flags
+        dies = out_of_bounds | (target_cells == Level.WALL)
+        leaving_tail_flat = tail_flat[~eats]
+        cell_flags[leaving_tail_flat] = True
+        dies |= (target_cells >= Level.HEAD) & ~cell_flags[target_flat]
+        cell_flags[leaving_tail_flat] = False
+        # Head-to-head collisions: several snakes moving into the same cell...
+        positions = np.arange(len(ids))
+        self.cell_claims[target_flat] = positions
+        cell_flags[target_flat[self.cell_claims[target_flat] != positions]] = True
+        dies |= cell_flags[target_flat]
+        cell_flags[target_flat] = False
+        # ...or two snakes moving into each other's head.
+        self.cell_claims[head_flat] = positions
+        has_other = (target_cells == Level.HEAD) & (target_flat != head_flat)
+        other = np.where(has_other, self.cell_claims[target_flat], 0)
+        dies |= has_other & (target_flat[other] == head_flat) & (target_flat == head_flat[other])
+
+        moving = ~dies
+        moving_ids = ids[moving]
+        dead_ids = ids[dies]
+        new_head_flat = target_flat[moving]
+        growing = eats[moving]
+
+        # Old heads become body, then tails that leave and dead snakes are cleared.
+        flat_arr[head_flat[moving]] = Level.BODY
+        cleared = [tail_flat[moving][~growing]]
+        cleared.extend(self.body_flat(k) for k in dead_ids)
+        cleared = np.concatenate(cleared)
+        level.set_flat_many(cleared, Level.EMPTY)
+        self.owners[cleared] = -1
+        shrinking_ids = moving_ids[~growing]
+        self.body_start[shrinking_ids] = (self.body_start[shrinking_ids] + 1) % self.body_capacity
+        self.body_length[shrinking_ids] -= 1
+
+        level.set_flat_many(new_head_flat, Level.HEAD)
+        self.owners[new_head_flat] = moving_ids
+        end = (self.body_start[moving_ids] + self.body_length[moving_ids]) % self.body_capacity
+        self.body_ring[moving_ids, end] = new_head_flat
+        self.body_length[moving_ids] += 1
+        self.head_flat[moving_ids] = new_head_flat
+
+        self.alive[dead_ids] = False
+        self.body_length[dead_ids] = 0
+
+        eater_ids = moving_ids[growing]
+        fruit_eaten[eater_ids] = True
+        self.latest_fruit_timestep[eater_ids] = self.timestep
+        for _ in range(len(eater_ids)):
+            self.spawn_fruit()
+
+        return fruit_eaten
+
+    def remove_snakes(self, snake_ids: Sequence[int]) -> None:
+        """
+        Removes living snakes from the level, as if they had died.
+        """
+        snake_ids = [k for k in snake_ids if self.alive[k]]
+        if not snake_ids:
+            return
+        cleared = np.concatenate([self.body_flat(k) for k in snake_ids])
+        self.level.set_flat_many(cleared, Level.EMPTY)
+        self.owners[cleared] = -1
+        self.alive[snake_ids] = False
+        self.body_length[snake_ids] = 0
+
+    def body_flat(self, k: int) -> np.ndarray:
+        """
+        Returns the flat indices of the body of snake k, ordered from tail to head.
+        """
+        offsets = np.arange(self.body_length[k])
+        return self.body_ring[k, (self.body_start[k] + offsets) % self.body_capacity]
+
+    def observations(self) -> np.ndarray:
+        """
+        Returns the level as seen by every snake, of shape (n_snakes, n_cells). A snake sees its
+        own head and body as HEAD and BODY, and the other snakes as OTHER_HEAD and OTHER_BODY.
+        """
+        flat_arr = self.level.flat_arr
+        owners = self.owners
+        others = (owners >= 0) & (owners != self.rows.reshape(-1, 1))
+        return np.where(others, flat_arr + (self.OTHER_HEAD - Level.HEAD), flat_arr)
@@ -0,0 +1,98 @@
+"""
+Observation encodings for the Ouroboros environment. Encoders read the environment's observation
+buffer, where body cells hold HEAD plus the move at which they became the head.
+"""
+from typing import Optional
+
+import numpy as np
+import gymnasium as gym
+
+from ouroboros.level import Level
+
+
+OBS_MODES = ["dense", "channels", "packed", "egocentric"]
+
+
+class DenseEncoder:
+    """
+    Whole level as a flat array. Body cells are numbered from the head (head is 1).
+    """
+    def __init__(self, level: Level, dtype=int) -> None:
+        flat_length = len(level.flat_arr)
+        assert np.iinfo(dtype).max >= flat_length, "dtype can't hold the body numbering"
+        assert np.issubdtype(dtype, np.signedinteger), "dtype can't hold fruit and walls"
+        self.dtype = dtype
+        self.observation_space = gym.spaces.Box(Level.WALL, flat_length, shape=(flat_length,), dtype=dtype)
+
+    def encode(self, obs_buffer: np.ndarray, level: Level, head_flat: int) -> np.ndarray:
+        head_value = obs_buffer[head_flat]
+        obs = np.where(obs_buffer >= Level.HEAD, head_value + Level.HEAD - obs_buffer, obs_buffer)
+        return obs.astype(self.dtype, copy=False)
+
+
+class ChannelEncoder:
+    """
+    Whole level as stacked binary channels for the head, body, fruit and walls, of shape
+    (4, flat_length). With `packed=True`, each channel is packed into bits along its last axis.
+    """
+    CHANNEL_VALUES = np.array([Level.HEAD, Level.BODY, Level.FRUIT, Level.WALL]).reshape(4, 1)
+
+    def __init__(self, level: Level, packed: bool = False) -> None:
+        flat_length = len(level.flat_arr)
+        self.packed = packed
+        if packed:
+            shape = (4, (flat_length + 7) // 8)
+            self.observation_space = gym.spaces.Box(0, 255, shape=shape, dtype=np.uint8)
+        else:
+            self.observation_space = gym.spaces.Box(0, 1, shape=(4, flat_length), dtype=np.uint8)
+
+    def encode(self, obs_buffer: np.ndarray, level: Level, head_flat: int) -> np.ndarray:
+        channels = level.flat_arr == self.CHANNEL_VALUES
+        if self.packed:
+            return np.packbits(channels, axis=1)
+        return channels.view(np.uint8)
+
+
+class EgocentricEncoder:
+    """
+    Window of side 2*radius+1 centered on the head, flattened. Body cells are numbered from the
+    head and cells outside of the level are shown as walls.
+    """
+    def __init__(self, level: Level, radius: int, dtype=int) -> None:
+        side = 2*radius + 1
+        window_length = side**level.ndim
+        assert np.iinfo(dtype).max >= len(level.flat_arr), "dtype can't hold the body numbering"
+        assert np.issubdtype(dtype, np.signedinteger), "dtype can't hold fruit and walls"
+        self.dtype = dtype
+        self.strides = np.array(level.strides)
+        self.upper_bounds = np.array(level.shape)
+        self.offsets = np.indices((side,)*level.ndim).reshape(level.ndim, window_length).T - radius
+        self.observation_space = gym.spaces.Box(Level.WALL, len(level.flat_arr), shape=(window_length,), dtype=dtype)
+
+    def encode(self, obs_buffer: np.ndarray, level: Level, head_flat: int) -> np.ndarray:
+        coords = self.offsets + np.array(level.position(head_flat))
+        in_bounds = np.all((coords >= 0) & (coords < self.upper_bounds), axis=1)
+        values = obs_buffer[coords[in_bounds] @ self.strides]
+        head_value = obs_buffer[head_flat]
+        values = np.where(values >= Level.HEAD, head_value + Level.HEAD - values, values)
+
+        obs = np.full(len(self.offsets), Level.WALL, dtype=self.dtype)
+        obs[in_bounds] = values
+        return obs
+
+
+def make_observation_encoder(level: Level, obs_mode: str, obs_dtype=int,
+                             obs_radius: Optional[int] = None):
+    """
+    Returns the observation encoder for an observation mode.
+    """
+    if obs_mode == "dense":
+        return DenseEncoder(level, obs_dtype)
+    if obs_mode == "channels":
+        return ChannelEncoder(level)
+    if obs_mode == "packed":
+        return ChannelEncoder(level, packed=True)
+    if obs_mode == "egocentric":
+        assert obs_radius is not None
+        return EgocentricEncoder(level, obs_radius, obs_dtype)
+    raise ValueError(f"Unknown observation mode {obs_mode}")
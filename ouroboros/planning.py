@@ -0,0 +1,199 @@
+"""
+Search-based planning agent. Plays without training by searching the game itself.
+"""
+import os
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+from ouroboros.level import Level
+from ouroboros.game import FlatGame
+
+
+def shortest_path(game: FlatGame, target_flat: int) -> Optional[list]:
+    """
+    Returns the direction indices of a shortest path from the head to `target_flat`, or None
+    when there is none. The path can go through empty cells, fruit, and body cells that the
+    tail will have left by the time the head gets there (assuming no fruit is eaten on the way).
+    """
+    level = game.level
+    flat_arr = level.flat_arr
+    n_directions = len(level.direction_strides)
+    # The body cell i moves away from the tail after i + 1 moves.
+    free_after = {flat: i + 1 for i, flat in enumerate(game.body_flat())}
+
+    parents = {game.head_flat: None}
+    distances = {game.head_flat: 0}
+    queue = deque([game.head_flat])
+    while queue:
+        flat = queue.popleft()
+        if flat == target_flat:
+            path = []
+            while parents[flat] is not None:
+                flat, direction_idx = parents[flat]
+                path.append(direction_idx)
+            return path[::-1]
+        distance = distances[flat] + 1
+        for direction_idx in range(n_directions):
+            if level.flat_out_of_bounds[direction_idx, flat]:
+                continue
+            next_flat = flat + level.direction_strides[direction_idx]
+            if next_flat in parents:
+                continue
+            cell = flat_arr[next_flat]
+            if cell == Level.EMPTY or cell == Level.FRUIT or \
+                    (cell >= Level.HEAD and free_after[next_flat] <= distance):
+                parents[next_flat] = (flat, direction_idx)
+                distances[next_flat] = distance
+                queue.append(next_flat)
+
+    return None
+
+
+def free_area(game: FlatGame) -> int:
+    """
+    Returns the number of cells the head can reach through empty cells, fruit and the tail.
+    """
+    level = game.level
+    flat_arr = level.flat_arr
+    tail_flat = game.body_ring[game.body_start]
+
+    seen = {game.head_flat}
+    stack = [game.head_flat]
+    while stack:
+        flat = stack.pop()
+        for direction_idx, stride in enumerate(level.direction_strides):
+            if level.flat_out_of_bounds[direction_idx, flat]:
+                continue
+            next_flat = flat + stride
+            if next_flat in seen:
+                continue
+            cell = flat_arr[next_flat]
+            if cell == Level.EMPTY or cell == Level.FRUIT or next_flat == tail_flat:
+                seen.add(next_flat)
+                stack.append(next_flat)
+
+    return len(seen) - 1
+
+
+class PlanningAgent:
+    """
+    Agent that plans on the game instead of using a trained policy. Every decision:
+    1. Finds a shortest path to the fruit with BFS and plays it out on the game, then checks
+       that the tail can still be reached from the new head. Taking the path is safe when it
+       can, since the snake can then always follow its tail.
+    2. Otherwise, stalls by taking the surviving move that keeps the tail reachable and is
+       farthest from it, breaking ties with the free area around the head.
+    Moves are simulated on the real game rules with snapshot() and restore(), so a decision
+    costs a few BFS passes and one simulated move per cell of the path.
+    """
+
+    def __init__(self, level_size: int, n_dims: int, seed: Optional[int] = None) -> None:
+        self.level_size = level_size
+        self.n_dims = n_dims
+        self.shape = (level_size,)*n_dims
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "PlanningAgent":
+        """
+        Returns the agent for the configuration in a train.get_model_path path. There is
+        nothing to load from disk, so the file doesn't have to exist.
+        """
+        _, n_dims, level_size, _ = os.path.basename(path).split(".")[0].split("_")
+        return cls(int(level_size), int(n_dims))
+
+    def choose_direction_idx(self, game: FlatGame) -> int:
+        """
+        Returns the direction index of the next move. The game is left as it was.
+        """
+        if game.curr_fruit_flat is not None:
+            path = shortest_path(game, game.curr_fruit_flat)
+            if path and self._is_safe(game, path):
+                return path[0]
+            if path:
+                # The shortest path is unsafe, so trying the shortest path after every first move.
+                direction_idx = self._safe_detour(game)
+                if direction_idx is not None:
+                    return direction_idx
+
+        best_direction_idx = game.direction_idx
+        best_score = None
+        for direction_idx in self.rng.permutation(2*game.level.ndim):
+            snapshot = game.snapshot()
+            game.change_direction_idx(direction_idx)
+            game.move()
+            if game.won():
+                game.restore(snapshot)
+                return direction_idx
+            if not game.finished:
+                tail_reachable = shortest_path(game, game.body_ring[game.body_start]) is not None
+                score = (tail_reachable, tail_reachable or free_area(game))
+                if best_score is None or score > best_score:
+                    best_direction_idx, best_score = direction_idx, score
+            game.restore(snapshot)
+
+        return int(best_direction_idx)
+
+    def _safe_detour(self, game: FlatGame) -> Optional[int]:
+        """
+        Returns the first move of the shortest safe path to the fruit that starts with any
+        move, or None when there is none.
+        """
+        best_direction_idx = None
+        best_length = None
+        for direction_idx in range(2*game.level.ndim):
+            snapshot = game.snapshot()
+            game.change_direction_idx(direction_idx)
+            fruit_eaten = game.move()
+            if fruit_eaten or game.finished:
+                game.restore(snapshot)
+                continue
+            path = shortest_path(game, game.curr_fruit_flat)
+            if path is not None and (best_length is None or len(path) < best_length) \
+                    and self._is_safe(game, path):
+                best_direction_idx, best_length = direction_idx, len(path)
+            game.restore(snapshot)
+
+        return best_direction_idx
+
+    def _is_safe(self, game: FlatGame, path: list) -> bool:
+        """
+        Returns True when, after following path, the game is won or the tail is reachable.
+        """
+        snapshot = game.snapshot()
+        for direction_idx in path:
+            game.change_direction_idx(direction_idx)
+            game.move()
+            if game.finished:
+                break
+        if game.finished:
+            safe = game.won()
+        else:
+            safe = game.body_length == 1 or shortest_path(game, game.body_ring[game.body_start]) is not None
+        game.restore(snapshot)
+
+        return safe
+
+    def game_from_observation(self, observation: np.ndarray) -> FlatGame:
+        """
+        Rebuilds the game from a dense observation where body cells are numbered from the head.
+        """
+        observation = np.asarray(observation).reshape(-1)
+        arr = np.where(observation > Level.HEAD, Level.BODY, observation).reshape(self.shape)
+        body_flat = np.flatnonzero(observation >= Level.HEAD)
+        body_flat = body_flat[np.argsort(-observation[body_flat], kind="stable")]
+        return FlatGame.from_body(Level(arr=arr), body_flat.tolist())
+
+    def predict(self, observation: np.ndarray, state = None, episode_start = None,
+                deterministic: bool = True) -> tuple:
+        """
+        Returns actions for one observation or a batch of observations, following the
+        stable-baselines3 predict interface. Expects the default dense observations.
+        """
+        observation = np.asarray(observation)
+        if observation.ndim == 1:
+            return np.array(self.choose_direction_idx(self.game_from_observation(observation))), None
+        actions = np.array([self.choose_direction_idx(self.game_from_observation(obs)) for obs in observation])
+        return actions, None
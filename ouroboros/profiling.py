@@ -0,0 +1,94 @@
+"""
+Opt-in timing instrumentation for games and environments.
+
+A Profiler times methods by replacing them with timed wrappers on the instance, so objects that
+aren't instrumented run exactly the same code as before. Times are inclusive: a phase that calls
+another instrumented phase (e.g. "move" spawning a fruit) includes the time of the inner phase.
+"""
+import functools
+import threading
+import time
+
+GAME_PHASES = {"move": "move", "spawn_fruit": "fruit_spawn"}
+LEVEL_PHASES = {"set_flat": "level_update"}
+ENV_PHASES = {
+    "step": "step",
+    "_update_obs_buffer": "obs_update",
+    "_get_obs": "obs_encode",
+    "_render_frame": "render_capture",
+}
+RECORDER_PHASES = {"record": "render_capture"}
+ANALYTICS_PHASES = {"update": "analytics_update"}
+
+
+class Profiler:
+    """
+    Call counts and total times per phase. With `thread_safe`, updates from concurrent threads
+    are serialized by a lock.
+    """
+
+    def __init__(self, thread_safe: bool = False) -> None:
+        self.counts = {}
+        self.totals = {}
+        self.lock = threading.Lock() if thread_safe else None
+
+    def add(self, phase: str, elapsed: float) -> None:
+        """
+        Records one call of a phase that took `elapsed` seconds.
+        """
+        if self.lock is None:
+            self.counts[phase] = self.counts.get(phase, 0) + 1
+            self.totals[phase] = self.totals.get(phase, 0.0) + elapsed
+            return
+        with self.lock:
+            self.counts[phase] = self.counts.get(phase, 0) + 1
+            self.totals[phase] = self.totals.get(phase, 0.0) + elapsed
+
+    def wrap(self, phase: str, func):
+        """
+        Returns func wrapped so that its calls are recorded under `phase`.
+        """
+        add = self.add
+        perf_counter = time.perf_counter
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                add(phase, perf_counter() - start)
+
+        return timed
+
+    def instrument(self, obj, phases: dict) -> None:
+        """
+        Times the methods of obj given by `phases`, a dict mapping method names to phase names.
+        """
+        for method_name, phase in phases.items():
+            setattr(obj, method_name, self.wrap(phase, getattr(obj, method_name)))
+
+    def instrument_game(self, game) -> None:
+        """
+        Times the phases of a game and of its level. A level is only instrumented once, so
+        games that reuse a level can be instrumented one after another.
+        """
+        self.instrument(game, GAME_PHASES)
+        if "set_flat" not in vars(game.level):
+            self.instrument(game.level, LEVEL_PHASES)
+
+    def stats(self) -> dict:
+        """
+        Returns the number of calls, the total time in seconds and the mean time in
+        microseconds of every phase.
+        """
+        return {phase: {"count": count,
+                        "total_sec": self.totals[phase],
+                        "mean_us": 1e6*self.totals[phase] / count}
+                for phase, count in self.counts.items()}
+
+    def reset(self) -> None:
+        """
+        Clears all counters.
+        """
+        self.counts, self.totals = {}, {}
@@ -0,0 +1,178 @@
+"""
+Recording games to an append-only binary file and reading them back with memory mapping.
+
+Each episode is written as one record once it ends:
+    int64 header: MAGIC, ndim, n_steps, n_diffs, *shape
+    int8 initial state (flat)
+    int64 step offsets: step t changes diffs[offsets[t]:offsets[t+1]]
+    int32 flat indices of the changed cells
+    int8 new values of the changed cells
+Every section is padded to a multiple of 8 bytes.
+"""
+import os
+import tempfile
+from typing import Optional
+
+import numpy as np
+
+
+MAGIC = int.from_bytes(b"OUROBORO", "little")
+ALIGNMENT = 8
+
+
+def _padding(n_bytes: int) -> bytes:
+    return bytes(-n_bytes % ALIGNMENT)
+
+
+class TrajectoryRecorder:
+    """
+    Records episodes as an initial state followed by per-step sparse diffs. Only the episode
+    being recorded is kept in memory; finished episodes are appended to the file. When
+    `temporary` is True, the file is deleted on close().
+    """
+
+    def __init__(self, path: str, temporary: bool = False) -> None:
+        self.path = path
+        self.temporary = temporary
+        self.prev_state = None
+        self.initial_state = None
+        self.diff_indices = []
+        self.diff_values = []
+
+    def record(self, state: np.ndarray) -> None:
+        """
+        Record the next state of the current episode. The first state starts a new episode.
+        """
+        flat_state = state.reshape(-1)
+        if self.prev_state is None:
+            self.initial_state = state.astype(np.int8)
+            self.prev_state = flat_state.copy()
+            return
+
+        changed = np.flatnonzero(self.prev_state != flat_state)
+        self.diff_indices.append(changed.astype(np.int32))
+        self.diff_values.append(flat_state[changed].astype(np.int8))
+        self.prev_state[changed] = flat_state[changed]
+
+    def end_episode(self) -> None:
+        """
+        Append the current episode to the file. Does nothing when no episode was started.
+        """
+        if self.prev_state is None:
+            return
+
+        n_steps = len(self.diff_indices)
+        step_offsets = np.zeros(n_steps + 1, dtype=np.int64)
+        step_offsets[1:] = np.cumsum([len(indices) for indices in self.diff_indices])
+        n_diffs = int(step_offsets[-1])
+        header = np.array([MAGIC, self.initial_state.ndim, n_steps, n_diffs,
+                           *self.initial_state.shape], dtype=np.int64)
+        diff_indices = np.concatenate(self.diff_indices + [np.zeros(0, dtype=np.int32)])
+        diff_values = np.concatenate(self.diff_values + [np.zeros(0, dtype=np.int8)])
+
+        with open(self.path, "ab") as f:
+            for section in (header, self.initial_state.reshape(-1), step_offsets, diff_indices, diff_values):
+                data = section.tobytes()
+                f.write(data)
+                f.write(_padding(len(data)))
+
+        self.prev_state = None
+        self.initial_state = None
+        self.diff_indices = []
+        self.diff_values = []
+
+    def close(self) -> None:
+        """
+        Append the current episode to the file, then delete the file if it is temporary.
+        """
+        self.end_episode()
+        if self.temporary and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class TrajectoryReader:
+    """
+    Random access to the episodes of a recording file through a memory map.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        if os.path.getsize(path) == 0:
+            self.mmap = np.zeros(0, dtype=np.uint8)
+        else:
+            self.mmap = np.memmap(path, dtype=np.uint8, mode="r")
+
+        # Walking the episode headers to locate every section.
+        self.episodes = []
+        offset = 0
+        while offset < len(self.mmap):
+            magic, ndim, n_steps, n_diffs = self._read(np.int64, 4, offset)
+            assert magic == MAGIC, f"{path} is not an Ouroboros recording"
+            shape = tuple(int(size) for size in self._read(np.int64, ndim, offset + 32))
+            offset += 8*(4 + int(ndim))
+            sections = {}
+            for name, dtype, count in (("initial_state", np.int8, int(np.prod(shape))),
+                                       ("step_offsets", np.int64, int(n_steps) + 1),
+                                       ("diff_indices", np.int32, int(n_diffs)),
+                                       ("diff_values", np.int8, int(n_diffs))):
+                sections[name] = self._read(dtype, count, offset)
+                n_bytes = count*np.dtype(dtype).itemsize
+                offset += n_bytes + len(_padding(n_bytes))
+            sections["shape"] = shape
+            sections["n_steps"] = int(n_steps)
+            self.episodes.append(sections)
+
+    def _read(self, dtype, count: int, offset: int) -> np.ndarray:
+        return np.frombuffer(self.mmap, dtype=dtype, count=count, offset=offset)
+
+    @property
+    def n_episodes(self) -> int:
+        return len(self.episodes)
+
+    def n_steps(self, episode: int) -> int:
+        """
+        Returns the number of recorded steps of an episode. It has n_steps + 1 states.
+        """
+        return self.episodes[episode]["n_steps"]
+
+    def initial_state(self, episode: int) -> np.ndarray:
+        """
+        Returns the first state of an episode.
+        """
+        record = self.episodes[episode]
+        return record["initial_state"].reshape(record["shape"]).astype(int)
+
+    def step_diff(self, episode: int, t: int) -> "tuple[np.ndarray, np.ndarray]":
+        """
+        Returns the flat indices and new values of the cells changed between states t and t+1.
+        """
+        record = self.episodes[episode]
+        start, end = record["step_offsets"][t:t+2]
+        return record["diff_indices"][start:end], record["diff_values"][start:end]
+
+    def state(self, episode: int, t: int) -> np.ndarray:
+        """
+        Returns state t of an episode by applying the first t diffs to the initial state.
+        """
+        record = self.episodes[episode]
+        end = record["step_offsets"][t]
+        # Keeping the last value written to every cell.
+        indices = record["diff_indices"][:end][::-1]
+        values = record["diff_values"][:end][::-1]
+        changed, last = np.unique(indices, return_index=True)
+
+        flat_state = record["initial_state"].astype(int)
+        flat_state[changed] = values[last]
+        return flat_state.reshape(record["shape"])
+
+
+def open_recording(path: Optional[str] = None) -> TrajectoryRecorder:
+    """
+    Returns a recorder writing to `path`, or to a new temporary file when path is None. The
+    temporary file is deleted when the recorder is closed.
+    """
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix="ouroboros_", suffix=".traj")
+        os.close(fd)
+        return TrajectoryRecorder(path, temporary=True)
+    return TrajectoryRecorder(path)
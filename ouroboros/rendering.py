@@ -0,0 +1,218 @@
+"""
+Rendering levels with pygame. 2D levels are drawn directly, and levels with more dimensions are
+drawn as a montage of 2D slices or as a 2D projection.
+"""
+from typing import Optional
+
+import numpy as np
+import pygame
+
+from ouroboros.level import Level
+
+
+class LevelRenderer:
+    """
+    Renders 2D levels through a lookup table from cell values to colors. Only the cells that
+    changed since the previous frame are redrawn.
+    With `render_mode="human"`, frames are drawn to a window at no more than `fps` frames per
+    second; a full redraw sets one pixel per cell and lets pygame scale the frame up. Cells
+    are shrunk so that the window fits in MAX_WINDOW_SIZE. With "rgb_array", frames are drawn
+    offscreen into an array without pygame and returned as (height, width, 3) arrays.
+    """
+    CELL_COLORS = {
+        Level.HEAD:  175,
+        Level.EMPTY: 0,
+        Level.BODY: 150,
+        Level.FRUIT: 255,
+        Level.WALL: 20,
+    }
+    # Redrawing the whole frame once more than this fraction of the cells changed.
+    FULL_REDRAW_FRACTION = 0.25
+    # Largest (width, height) of a window, in pixels.
+    MAX_WINDOW_SIZE = (1600, 1000)
+
+    def __init__(self, shape: tuple, expansion: int = 20, render_mode: str = "human",
+                 fps: Optional[int] = None, caption: str = "Ouroboros",
+                 cell_colors: Optional[dict] = None) -> None:
+        assert len(shape) == 2
+        assert render_mode in ("human", "rgb_array")
+        if render_mode == "human":
+            expansion = max(1, min(expansion, self.MAX_WINDOW_SIZE[0] // shape[1],
+                                   self.MAX_WINDOW_SIZE[1] // shape[0]))
+        self.shape = shape
+        self.expansion = expansion
+        self.render_mode = render_mode
+        self.fps = fps
+        self.caption = caption
+        self.size = (shape[1]*expansion, shape[0]*expansion)
+
+        # Row v - min_value of the palette holds the color of cells of value v. Gray levels are
+        # mapped through pygame's default 8-bit palette, like 2D surfarrays are.
+        if cell_colors is None:
+            cell_colors = self.CELL_COLORS
+        self.palette_offset = -min(cell_colors)
+        self.palette = np.zeros((max(cell_colors) + self.palette_offset + 1, 3), dtype=np.uint8)
+        for value, gray in cell_colors.items():
+            color = pygame.surfarray.make_surface(np.array([[gray]])).get_at((0, 0))
+            self.palette[value + self.palette_offset] = tuple(color)[:3]
+
+        self.cells = None
+        self.screen = None
+        self.frame = None
+        self.clock = None
+        self.pixels = None
+
+    def _open(self) -> None:
+        if self.render_mode == "human":
+            pygame.display.init()
+            self.screen = pygame.display.set_mode(self.size)
+            pygame.display.set_caption(self.caption)
+            self.frame = pygame.Surface((self.shape[1], self.shape[0]), depth=32)
+            self.clock = pygame.time.Clock()
+        else:
+            self.pixels = np.zeros((self.size[1], self.size[0], 3), dtype=np.uint8)
+            # View of the pixels as (row, y, col, x, channel) to address whole cells.
+            self.pixel_cells = self.pixels.reshape(self.shape[0], self.expansion,
+                                                   self.shape[1], self.expansion, 3)
+
+    def render(self, arr: np.ndarray, changed_flat: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        Draws a level. `changed_flat` lists the flat indices of the cells changed since the last
+        frame; by default they are found by comparing with the last frame. Returns the frame
+        in "rgb_array" mode.
+        """
+        if self.screen is None and self.pixels is None:
+            self._open()
+
+        flat_arr = arr.reshape(-1)
+        if self.cells is None:
+            changed_flat = None
+            self.cells = flat_arr.copy()
+        elif changed_flat is None:
+            changed_flat = np.flatnonzero(self.cells != flat_arr)
+
+        full_redraw = changed_flat is None or len(changed_flat) > self.FULL_REDRAW_FRACTION*len(flat_arr)
+        if self.render_mode == "rgb_array":
+            if full_redraw:
+                colors = np.take(self.palette, arr + self.palette_offset, axis=0)
+                self.pixel_cells[:] = colors[:, None, :, None, :]
+            else:
+                for flat_idx in changed_flat.tolist():
+                    row, col = divmod(flat_idx, self.shape[1])
+                    self.pixel_cells[row, :, col, :] = self.palette[flat_arr[flat_idx] + self.palette_offset]
+            np.copyto(self.cells, flat_arr)
+            return self.pixels.copy()
+
+        if full_redraw:
+            colors = np.take(self.palette, arr.T + self.palette_offset, axis=0)
+            pygame.surfarray.blit_array(self.frame, colors)
+            pygame.transform.scale(self.frame, self.size, self.screen)
+            dirty_rects = None
+        else:
+            dirty_rects = []
+            for flat_idx in changed_flat.tolist():
+                row, col = divmod(flat_idx, self.shape[1])
+                rect = (col*self.expansion, row*self.expansion, self.expansion, self.expansion)
+                self.screen.fill(self.palette[flat_arr[flat_idx] + self.palette_offset], rect)
+                dirty_rects.append(rect)
+        np.copyto(self.cells, flat_arr)
+
+        pygame.event.pump()
+        if dirty_rects is None:
+            pygame.display.update()
+        elif dirty_rects:
+            pygame.display.update(dirty_rects)
+        if self.fps is not None:
+            self.clock.tick(self.fps)
+        return None
+
+    def close(self) -> None:
+        if self.screen is not None:
+            pygame.display.quit()
+        self.screen = None
+        self.pixels = None
+        self.cells = None
+
+
+class VoxelViewer:
+    """
+    Persistent view of levels with 3 or more dimensions, drawn by a LevelRenderer.
+    In "slices" mode, every 2D slice over the first two axes is shown in a montage: the third
+    axis runs along the columns of the montage and the remaining axes along its rows. In
+    "projection" mode, the level is projected along all axes but the first two, showing the
+    most important cell of every line (head, then fruit, body, wall and empty). Montages that
+    wouldn't fit in LevelRenderer.MAX_WINDOW_SIZE even with one pixel per cell are shown as a
+    projection instead.
+    Cells are written into the montage through a precomputed index table, and only the cells
+    that changed are redrawn.
+    """
+    SEPARATOR = Level.BODY + 1
+    CELL_COLORS = {**LevelRenderer.CELL_COLORS, SEPARATOR: 73}
+    VIEW_MODES = ["slices", "projection"]
+    # Cell values ordered from least to most important in projections.
+    PROJECTION_ORDER = [Level.EMPTY, Level.WALL, Level.BODY, Level.FRUIT, Level.HEAD]
+
+    def __init__(self, shape: tuple, view_mode: str = "slices", expansion: int = 12,
+                 render_mode: str = "human", fps: Optional[int] = None,
+                 caption: str = "Ouroboros") -> None:
+        assert len(shape) >= 3
+        assert view_mode in self.VIEW_MODES
+        n_tile_cols = shape[2]
+        n_tile_rows = int(np.prod(shape[3:], dtype=int))
+        montage_shape = (n_tile_rows*(shape[0] + 1) - 1, n_tile_cols*(shape[1] + 1) - 1)
+        max_width, max_height = LevelRenderer.MAX_WINDOW_SIZE
+        if montage_shape[0] > max_height or montage_shape[1] > max_width:
+            view_mode = "projection"
+        self.shape = shape
+        self.view_mode = view_mode
+
+        if view_mode == "slices":
+            coords = np.indices(shape).reshape(len(shape), -1)
+            tile_rows = np.ravel_multi_index(coords[3:], shape[3:]) if len(shape) > 3 else 0
+            rows = tile_rows*(shape[0] + 1) + coords[0]
+            cols = coords[2]*(shape[1] + 1) + coords[1]
+            self.montage_flat = np.ravel_multi_index((rows, cols), montage_shape)
+            self.view = np.full(montage_shape, self.SEPARATOR)
+        else:
+            rank = np.zeros(max(self.PROJECTION_ORDER) - min(self.PROJECTION_ORDER) + 1, dtype=int)
+            rank[np.array(self.PROJECTION_ORDER) - min(self.PROJECTION_ORDER)] = np.arange(len(self.PROJECTION_ORDER))
+            self.rank_offset = -min(self.PROJECTION_ORDER)
+            self.rank = rank
+            self.ranked_values = np.array(self.PROJECTION_ORDER)
+            self.view = np.full(shape[:2], Level.EMPTY)
+        self.flat_view = self.view.reshape(-1)
+
+        self.renderer = LevelRenderer(self.view.shape, expansion, render_mode, fps, caption,
+                                      cell_colors=self.CELL_COLORS)
+
+    def render(self, arr: np.ndarray, changed_flat: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        Draws a level. `changed_flat` lists the flat indices of the level's cells changed since
+        the last frame; by default all cells are copied and the view is compared with the last
+        frame. Returns the frame in "rgb_array" mode.
+        """
+        flat_arr = arr.reshape(-1)
+        if self.view_mode == "projection":
+            ranks = np.take(self.rank, arr + self.rank_offset)
+            top = ranks.reshape(*self.shape[:2], -1).max(axis=-1)
+            self.view[:] = self.ranked_values[top]
+            return self.renderer.render(self.view)
+
+        if changed_flat is None or self.renderer.cells is None:
+            self.flat_view[self.montage_flat] = flat_arr
+            return self.renderer.render(self.view)
+        self.flat_view[self.montage_flat[changed_flat]] = flat_arr[changed_flat]
+        return self.renderer.render(self.view, self.montage_flat[changed_flat])
+
+    def close(self) -> None:
+        self.renderer.close()
+
+
+def make_renderer(shape: tuple, expansion: int = 20, render_mode: str = "human",
+                  fps: Optional[int] = None, view_mode: str = "slices"):
+    """
+    Returns a LevelRenderer for 2D levels and a VoxelViewer otherwise.
+    """
+    if len(shape) == 2:
+        return LevelRenderer(shape, expansion, render_mode, fps)
+    return VoxelViewer(shape, view_mode, max(1, expansion // 2), render_mode, fps)
@@ -0,0 +1,222 @@
+"""
+Defining a natively vectorized gymnasium environment for Ouroboros to speed up reinforcement learning.
+"""
+from typing import Optional, Union, Sequence
+
+import numpy as np
+import gymnasium as gym
+from stable_baselines3.common.vec_env import VecEnv
+
+from ouroboros.level import Level
+from ouroboros.batched_game import BatchedGame
+
+# Before gymnasium 1.0, VectorEnv.__init__ sets up the batched spaces and the `closed` flag.
+VECTOR_ENV_HAS_INIT = gym.vector.VectorEnv.__init__ is not object.__init__
+
+
+class OuroborosVectorEnv(gym.vector.VectorEnv):
+    """
+    Vector environment for Ouroboros. Every sub-environment behaves like an `Ouroboros`
+    environment, but all games are stepped together by a single `BatchedGame`. Finished and
+    truncated episodes are reset in place during the same step.
+    """
+
+    metadata = {"render_modes": []}
+    # Autoreset modes were added in gymnasium 1.1. Older vector envs always reset in the same step.
+    if hasattr(gym.vector, "AutoresetMode"):
+        metadata["autoreset_mode"] = gym.vector.AutoresetMode.SAME_STEP
+
+    def __init__(self, num_envs: int, level_size: int, n_dims: int,
+                 max_timesteps: Optional[int] = None) -> None:
+        """
+        Vector environment initialization. Spaces, rewards and `max_timesteps` follow
+        the `Ouroboros` environment.
+        """
+        self.num_envs = num_envs
+        self.level_size = level_size
+        self.n_dims = n_dims
+        self.render_mode = None
+
+        self.game = BatchedGame(num_envs, level_size, n_dims)
+        flat_length = self.game.n_cells
+        if max_timesteps is None:
+            self.max_timesteps = flat_length*4
+        else:
+            self.max_timesteps = max_timesteps
+
+        self.single_observation_space = gym.spaces.Box(Level.WALL, flat_length, shape=(flat_length,), dtype=int)
+        self.single_action_space = gym.spaces.Discrete(n_dims*2)
+        if VECTOR_ENV_HAS_INIT:
+            super().__init__(num_envs, self.single_observation_space, self.single_action_space)
+        else:
+            self.observation_space = gym.vector.utils.batch_space(self.single_observation_space, num_envs)
+            self.action_space = gym.vector.utils.batch_space(self.single_action_space, num_envs)
+
+        self.rows = np.arange(num_envs)
+        self.directions = np.zeros((num_envs, n_dims), dtype=int)
+        self.observations = np.zeros((num_envs, flat_length), dtype=int)
+
+    def _get_obs(self, env_ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Writes the current observations of the given sub-environments (all by default) into
+        `self.observations` and returns it. Body cells are numbered from the head like in
+        `Ouroboros._get_obs`.
+        """
+        game = self.game
+        if env_ids is None:
+            env_ids = self.rows
+        self.observations[env_ids] = game.flat_boards[env_ids]
+
+        body_length = game.body_length[env_ids]
+        offsets = np.arange(body_length.max(initial=0))
+        in_body = offsets < body_length[:, None]
+        slots = (game.body_start[env_ids, None] + offsets) % game.body_capacity
+        body_flat = game.body[env_ids[:, None], slots]
+        counters = Level.HEAD + body_length[:, None] - 1 - offsets
+        rows = np.broadcast_to(env_ids[:, None], in_body.shape)
+        self.observations[rows[in_body], body_flat[in_body]] = counters[in_body]
+
+        return self.observations
+
+    def _get_info(self, env_ids: Optional[np.ndarray] = None) -> dict:
+        """
+        Returns auxiliary information in the gymnasium vector format.
+        """
+        if env_ids is None:
+            env_ids = self.rows
+        mask = np.zeros(self.num_envs, dtype=bool)
+        mask[env_ids] = True
+        snake_length = np.where(mask, self.game.snake_length, 0)
+        return {'snake_length': snake_length, '_snake_length': mask}
+
+    def actions_to_directions(self, actions: np.ndarray) -> np.ndarray:
+        """
+        Returns an array of directions of shape (num_envs, n_dims) given a batch of actions
+        from the action space.
+        """
+        actions = np.asarray(actions)
+        self.directions[:] = 0
+        self.directions[self.rows, actions % self.n_dims] = np.where(actions // self.n_dims == 1, -1, 1)
+
+        return self.directions
+
+    def reset(self, seed: Optional[Union[int, Sequence[int]]] = None, options = None) -> tuple:
+        """
+        Resets every sub-environment. An integer seed gives sub-environment i the seed `seed + i`.
+        """
+        if seed is not None:
+            if isinstance(seed, int):
+                seed = [seed + i for i in range(self.num_envs)]
+            self.game.rngs = [np.random.default_rng(s) for s in seed]
+        self.game.reset()
+        observations = self._get_obs().copy()
+        infos = self._get_info()
+
+        return observations, infos
+
+    def step(self, actions: np.ndarray) -> tuple:
+        """
+        Move every snake forward once based on the selected directions. Sub-environments that
+        terminate or get truncated are reset; their last observation and info are returned in
+        `infos["final_obs"]` and `infos["final_info"]`.
+        """
+        live = ~self.game.finished
+        self.game.change_direction(self.actions_to_directions(actions))
+        fruit_eaten = self.game.move()
+
+        rewards = fruit_eaten.astype(float)
+        terminations = live & self.game.finished
+        rewards[terminations & self.game.won()] += 1000
+        truncations = (self.game.timestep - self.game.latest_fruit_timestep) >= self.max_timesteps
+        observations = self._get_obs()
+        infos = self._get_info()
+
+        done = terminations | truncations
+        if np.any(done):
+            done_ids = np.flatnonzero(done)
+            final_obs = np.zeros_like(observations)
+            final_obs[done_ids] = observations[done_ids]
+            infos['final_obs'] = final_obs
+            infos['_final_obs'] = done
+            infos['final_info'] = self._get_info(done_ids)
+            infos['_final_info'] = done
+
+            self.game.reset(done_ids)
+            self._get_obs(done_ids)
+            infos['snake_length'][done_ids] = self.game.snake_length[done_ids]
+
+        return observations.copy(), rewards, terminations, truncations, infos
+
+
+class OuroborosSB3VecEnv(VecEnv):
+    """
+    Adapter exposing an `OuroborosVectorEnv` as a stable-baselines3 `VecEnv`.
+    All games are stepped by one BatchedGame, so only some attributes exist per sub-environment:
+    the settings shared by all of them, their spaces, and the per-game counters of the
+    BatchedGame. Other attributes and all env methods raise AttributeError.
+    """
+    SHARED_ATTRIBUTES = {"render_mode", "metadata", "level_size", "n_dims", "max_timesteps"}
+    SPACE_ATTRIBUTES = {"observation_space", "action_space"}
+    GAME_ATTRIBUTES = {"timestep", "snake_length", "latest_fruit_timestep", "finished"}
+
+    def __init__(self, venv: OuroborosVectorEnv) -> None:
+        self.venv = venv
+        self.actions = None
+        self.reset_seed = None
+        super().__init__(venv.num_envs, venv.single_observation_space, venv.single_action_space)
+
+    def reset(self) -> np.ndarray:
+        observations, _ = self.venv.reset(seed=self.reset_seed)
+        self.reset_seed = None
+        return observations
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self.actions = actions
+
+    def step_wait(self) -> tuple:
+        observations, rewards, terminations, truncations, infos = self.venv.step(self.actions)
+        dones = terminations | truncations
+
+        env_infos = [{'snake_length': int(snake_length)} for snake_length in infos['snake_length']]
+        for i in np.flatnonzero(dones):
+            env_infos[i]['snake_length'] = int(infos['final_info']['snake_length'][i])
+            env_infos[i]['terminal_observation'] = infos['final_obs'][i]
+            env_infos[i]['TimeLimit.truncated'] = bool(truncations[i] and not terminations[i])
+
+        return observations, rewards.astype(np.float32), dones, env_infos
+
+    def seed(self, seed: Optional[int] = None) -> list:
+        self.reset_seed = seed
+        return [None if seed is None else seed + i for i in range(self.num_envs)]
+
+    def close(self) -> None:
+        self.venv.close()
+
+    def get_attr(self, attr_name: str, indices = None) -> list:
+        indices = self._get_indices(indices)
+        if attr_name in self.GAME_ATTRIBUTES:
+            values = getattr(self.venv.game, attr_name)
+            return [values[i].item() for i in indices]
+        if attr_name in self.SPACE_ATTRIBUTES:
+            value = getattr(self.venv, f"single_{attr_name}")
+        elif attr_name in self.SHARED_ATTRIBUTES:
+            value = getattr(self.venv, attr_name)
+        else:
+            raise AttributeError(f"{attr_name} is not available per sub-environment of a batched env")
+        return [value for _ in indices]
+
+    def set_attr(self, attr_name: str, value, indices = None) -> None:
+        """
+        Sets a shared setting. Settings can only be changed for all sub-environments at once.
+        """
+        if attr_name not in self.SHARED_ATTRIBUTES:
+            raise AttributeError(f"{attr_name} can't be set per sub-environment of a batched env")
+        if sorted(self._get_indices(indices)) != list(range(self.num_envs)):
+            raise AttributeError(f"{attr_name} is shared by all sub-environments of a batched env")
+        setattr(self.venv, attr_name, value)
+
+    def env_method(self, method_name: str, *method_args, indices = None, **method_kwargs) -> list:
+        raise AttributeError(f"{method_name} can't be called per sub-environment of a batched env")
+
+    def env_is_wrapped(self, wrapper_class, indices = None) -> list:
+        return [False for _ in self._get_indices(indices)]
@@ -0,0 +1,142 @@
+"""
+CPU-heavy game and agent work for the server. Functions at module level can be sent to a
+process pool, where every worker process keeps its own cache of loaded agents.
+"""
+import queue
+import itertools
+
+import numpy as np
+
+from ouroboros.level import Level
+from ouroboros.game import Game
+from ouroboros.environment import Ouroboros
+
+from model_cache import ModelCache
+from wire_format import compute_game_diff
+
+WORKER_MODEL_CACHE_SIZE = 4
+CANCEL_CHECK_INTERVAL = 16
+FRAME_PUT_TIMEOUT = 1.0
+
+worker_models = ModelCache(max_models=WORKER_MODEL_CACHE_SIZE)
+
+
+def preload_worker_models(configurations: list) -> None:
+    """
+    Process pool initializer. Loads the agents of the given configurations in the new worker,
+    so that its first rollouts skip importing and deserializing them.
+    """
+    worker_models.preload(configurations)
+
+
+def worker_ready() -> int:
+    """
+    No-op task used to start a worker ahead of the first request. Returns the number of
+    loaded agents.
+    """
+    return len(worker_models)
+
+
+class RolloutCancelled(Exception):
+    """
+    Raised in a worker when the request that started a rollout has gone away.
+    """
+
+
+def create_game(level_size: int, n_dims: int) -> Game:
+    """
+    Builds a new game on an empty level.
+    """
+    level = Level(level_size=level_size, n_dims=n_dims)
+    return Game(level=level)
+
+
+def generate_agent_game(model, level_size: int, n_dims: int, cancel_event = None):
+    """
+    Plays one episode with a loaded agent. Yields the initial state and then, as the agent
+    moves, the flat indices and new values of the cells changed by every step. Stops with
+    RolloutCancelled once `cancel_event` is set.
+    """
+    env = Ouroboros(level_size, n_dims)
+    observation, _ = env.reset()
+    state = env.game.level.arr.copy()
+    yield state.copy()
+
+    flat_state = state.reshape(-1)
+    done = False
+    while not done:
+        if cancel_event is not None and env.game.timestep % CANCEL_CHECK_INTERVAL == 0 \
+                and cancel_event.is_set():
+            raise RolloutCancelled()
+        action, _ = model.predict(observation, deterministic=True)
+        observation, _, terminated, truncated, _ = env.step(int(action))
+        done = terminated or truncated
+        diff_indices, diff_values = compute_game_diff(flat_state, env.game.level.flat_arr)
+        flat_state[diff_indices] = diff_values
+        yield diff_indices, diff_values
+
+
+def simulate_agent_game(model, level_size: int, n_dims: int,
+                        cancel_event = None) -> "tuple[np.ndarray, list]":
+    """
+    Plays one episode with a loaded agent. Returns the initial state and the flat indices and
+    new values of the cells changed by every step.
+    """
+    initial_state, *diffs = generate_agent_game(model, level_size, n_dims, cancel_event)
+    return initial_state, diffs
+
+
+def simulate_agent_game_from_configuration(configuration: tuple, level_size: int, n_dims: int,
+                                           cancel_event = None) -> "tuple[np.ndarray, list]":
+    """
+    Process pool entry point for simulate_agent_game. `configuration` is the
+    (model_name, n_dims, level_size, train_timesteps) key of the agent.
+    """
+    model = worker_models.get(*configuration)
+    return simulate_agent_game(model, level_size, n_dims, cancel_event)
+
+
+def batched(iterable, batch_size: int):
+    """
+    Yields lists of up to batch_size consecutive items.
+    """
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
+
+
+def put_frame(frames, frame, cancel_event) -> None:
+    """
+    Puts a frame on a bounded queue, waiting while it is full. Raises RolloutCancelled once
+    `cancel_event` is set.
+    """
+    while True:
+        try:
+            frames.put(frame, timeout=FRAME_PUT_TIMEOUT)
+            return
+        except queue.Full:
+            if cancel_event.is_set():
+                raise RolloutCancelled()
+
+
+def stream_agent_game_from_configuration(configuration: tuple, level_size: int, n_dims: int,
+                                         batch_size: int, frames, cancel_event) -> None:
+    """
+    Process pool entry point for streaming an episode. Puts the initial state on the `frames`
+    queue, then lists of up to batch_size consecutive diffs as the agent plays, then None. If
+    the rollout fails, the exception is put on the queue instead.
+    """
+    try:
+        model = worker_models.get(*configuration)
+        agent_game = generate_agent_game(model, level_size, n_dims, cancel_event)
+        put_frame(frames, next(agent_game), cancel_event)
+        for batch in batched(agent_game, batch_size):
+            put_frame(frames, batch, cancel_event)
+        put_frame(frames, None, cancel_event)
+    except RolloutCancelled:
+        pass
+    except Exception as e:
+        try:
+            put_frame(frames, e, cancel_event)
+        except RolloutCancelled:
+            pass
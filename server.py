@@ -2,58 +2,187 @@
 Functions that facilitate the link between Ouroboros and the Hydra frontend.
 """
 import os
+import sys
+import json
+import queue
+import atexit
+import time
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
 import numpy as np
-from stable_baselines3.common.evaluation import evaluate_policy
-
-from ouroboros.level import Level
-from ouroboros.game import Game
-from ouroboros.environment import Ouroboros
 
 from flask import jsonify
+from flask import request
+from flask import abort
 from flask import Flask
+from flask import Response
+from flask import g
 from flask_cors import CORS
 
-from train import (get_model_path, 
-                   get_model_class, 
-                   get_model_configuration_from_filename)
+from ouroboros.profiling import Profiler
+
+from sessions import GameSessionStore
+from rollouts import (create_game,
+                      preload_worker_models,
+                      simulate_agent_game_from_configuration,
+                      stream_agent_game_from_configuration,
+                      worker_ready)
+from wire_format import (ENCODINGS,
+                         WIRE_DTYPE,
+                         compute_game_diff,
+                         diff_to_dict,
+                         pack_diff,
+                         rle_encode,
+                         to_base64)
+
+from train import MODELS_DIR, get_model_configuration_from_filename
+
+MAX_SESSIONS = 10_000
+SESSION_TTL = 3600
+PROCESS_WORKERS = os.cpu_count() or 1
+ROLLOUT_TIMEOUT = 300
+STREAM_BATCH_SIZE = 32
+STREAM_QUEUE_SIZE = 8
+PLANNER_CONFIGURATIONS = [["planner", 2, 9, 0], ["planner", 3, 9, 0]]
+PROFILE = os.environ.get("OUROBOROS_PROFILE", "0") == "1"
 
 app = Flask(__name__)
-cors = CORS(app)
+cors = CORS(app, expose_headers=["X-Session-Id", "X-State-Shape"])
+
+sessions = GameSessionStore(max_sessions=MAX_SESSIONS, ttl=SESSION_TTL)
+
+# CPU-heavy work runs in worker processes so that it doesn't hold the server's GIL. The pool
+# is started on first use, and its workers load the agents when they start.
+process_context = multiprocessing.get_context("spawn")
+process_pool = None
+process_manager = None
+process_lock = threading.Lock()
 
-game = None
+# cancel_futures was added to Executor.shutdown in Python 3.9.
+SHUTDOWN_OPTIONS = {"wait": False, "cancel_futures": True} if sys.version_info >= (3, 9) else {"wait": False}
 
+# Request and game phase timings served by /metrics. Only collected when OUROBOROS_PROFILE=1.
+profiler = Profiler(thread_safe=True) if PROFILE else None
 
-def get_game_diff(state: np.ndarray, next_state: np.ndarray) -> dict:
+
+if profiler is not None:
+    @app.before_request
+    def start_request_timer() -> None:
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def stop_request_timer(response: Response) -> Response:
+        if "request_start" in g:
+            profiler.add(f"request:{request.endpoint}", time.perf_counter() - g.request_start)
+        return response
+
+
+def get_encoding() -> str:
     """
-    Returns a dict mapping changed indices in the game state to their updated values.
+    Returns the response encoding requested with the `encoding` query parameter.
     """
-    diff_indices = np.nonzero(state - next_state)
-    result = {}
+    encoding = request.args.get("encoding", "json")
+    if encoding not in ENCODINGS:
+        abort(400, f"Unknown encoding {encoding}, expected one of {ENCODINGS}")
+    return encoding
+
 
-    flat_diff_indices = np.ravel_multi_index(diff_indices, dims=state.shape)
-    for i, idx in enumerate(zip(*diff_indices)):
-        flat_idx = int(flat_diff_indices[i])
-        result[flat_idx] = int(next_state[idx])
-    
-    return result
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Returns the process pool, starting it on the first call.
+    """
+    global process_pool
+    with process_lock:
+        if process_pool is None:
+            process_pool = ProcessPoolExecutor(max_workers=PROCESS_WORKERS, mp_context=process_context,
+                                               initializer=preload_worker_models,
+                                               initargs=(list_agent_configurations(),))
+    return process_pool
+
+
+def get_process_manager():
+    """
+    Returns the manager process that shares cancel events with the workers, starting it on
+    the first call.
+    """
+    global process_manager
+    with process_lock:
+        if process_manager is None:
+            process_manager = process_context.Manager()
+    return process_manager
+
+
+def new_cancel_event():
+    """
+    Returns an event that can be passed to a worker process to cancel its work.
+    """
+    return get_process_manager().Event()
+
+
+@atexit.register
+def shutdown_pools() -> None:
+    """
+    Stops the process pool and the manager process behind the cancel events.
+    """
+    with process_lock:
+        if process_pool is not None:
+            process_pool.shutdown(**SHUTDOWN_OPTIONS)
+        if process_manager is not None:
+            process_manager.shutdown()
+
+
+async def run_in_process(func, *args, cancel_event = None):
+    """
+    Runs func(*args) on the process pool without blocking the event loop. When the request
+    is cancelled (e.g. the client disconnected) or takes longer than ROLLOUT_TIMEOUT seconds,
+    `cancel_event` is set so that the worker stops early.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(get_process_pool(), func, *args)
+    try:
+        return await asyncio.wait_for(future, ROLLOUT_TIMEOUT)
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        if cancel_event is not None:
+            cancel_event.set()
+        raise
+
+
+def binary_response(packed: np.ndarray, headers: Optional[dict] = None) -> Response:
+    return Response(packed.astype(WIRE_DTYPE, copy=False).tobytes(),
+                    mimetype="application/octet-stream", headers=headers)
         
 
 @app.route("/init/<level_size>/<n_dims>")
 def init_game(level_size: int, n_dims: int) -> None:
     """
-    Initialize an Ouroboros game from frontend input.
-    Returns initial game state.
+    Initialize an Ouroboros game from frontend input in a new session.
+    Returns initial game state and the session id to pass to /progress.
+    With `encoding=base64`, the state is run-length encoded (see wire_format). With
+    `encoding=binary`, the body is the run-length encoded state and the session id and
+    state shape are sent in the X-Session-Id and X-State-Shape headers.
     """
-    # TODO: Investigate whether tokens are necessary for game initialization (and progressing)
-    global game
+    encoding = get_encoding()
     level_size = int(level_size)
     n_dims = int(n_dims)
 
-    level = Level(level_size=level_size, n_dims=n_dims)
-    game = Game(level=level)
+    game = create_game(level_size, n_dims)
+    if profiler is not None:
+        profiler.instrument_game(game)
+    session_id = sessions.create(game)
 
-    state = game.level.arr.tolist()
-    result = {"state": state}
+    if encoding == "binary":
+        headers = {"X-Session-Id": session_id,
+                   "X-State-Shape": ",".join(map(str, game.level.shape))}
+        return binary_response(rle_encode(game.level.arr), headers)
+    if encoding == "base64":
+        result = {"state": to_base64(rle_encode(game.level.arr)),
+                  "shape": list(game.level.shape),
+                  "session_id": session_id}
+    else:
+        result = {"state": game.level.arr.tolist(), "session_id": session_id}
 
     return jsonify(result)
 
@@ -61,36 +190,51 @@ def init_game(level_size: int, n_dims: int) -> None:
 @app.route("/progress/<direction_int>")
 def progress_game(direction_int: int) -> "tuple[list, int]":
     """
-    Progress an Ouroboros game given an input direction.
+    Progress the Ouroboros game of the session given by the `session_id` query parameter
+    in an input direction.
     Returns state matrix as nested lists and game status. 
     Status map: 0: Playing, 1: Lost, 2: Won
+    With `encoding=base64`, the diff is a packed diff (see wire_format). With `encoding=binary`,
+    the body is the status followed by the packed diff.
     """
-    global game
+    encoding = get_encoding()
     direction_int = int(direction_int)
+    session = sessions.get(request.args.get("session_id", ""))
+    if session is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
 
-    direction = np.zeros(game.level.ndim, dtype=int)
-    if direction_int > 0:
-        direction[direction_int-1] = 1
-    else:
-        direction[abs(direction_int)-1] = -1
+    with session.lock:
+        game = session.game
+        direction = np.zeros(game.level.ndim, dtype=int)
+        if direction_int > 0:
+            direction[direction_int-1] = 1
+        else:
+            direction[abs(direction_int)-1] = -1
 
-    state = game.level.arr.copy()
+        state = game.level.arr.copy()
 
-    game.change_direction(direction)
-    game.move()
-    
-    next_state = game.level.arr
-    diff_dict = get_game_diff(state, next_state)
+        game.change_direction(direction)
+        game.move()
+        
+        next_state = game.level.arr
+        diff_indices, diff_values = compute_game_diff(state, next_state)
 
-    if game.won():
-        status = 2
-    elif game.finished:
-        status = 1
+        if game.won():
+            status = 2
+        elif game.finished:
+            status = 1
+        else:
+            status = 0
+
+    if encoding == "binary":
+        return binary_response(np.concatenate([[status], pack_diff(diff_indices, diff_values)]))
+    if encoding == "base64":
+        diff = to_base64(pack_diff(diff_indices, diff_values))
     else:
-        status = 0
+        diff = diff_to_dict(diff_indices, diff_values)
 
     result = {
-        "diff": diff_dict,
+        "diff": diff,
         "status": status,
     }
 
@@ -98,50 +242,190 @@ def progress_game(direction_int: int) -> "tuple[list, int]":
 
 
 @app.route("/game_from_agent/<level_size>/<n_dims>/<model_name>/<train_timesteps>")
-def get_game_from_agent(level_size: int, n_dims: int, model_name: str, train_timesteps: int):
+async def get_game_from_agent(level_size: int, n_dims: int, model_name: str, train_timesteps: int):
     """
     Returns a simulated game using an agent trained under the specified configuration.
     Returned list is of shape (num_timesteps, *) where * is the shape of the game's state matrix.
     Assumes an agent with the appropriate configuration has been already trained. Otherwise, an
     exception is raised.
+    With `encoding=base64`, the initial state is run-length encoded and diffs are packed (see
+    wire_format). With `encoding=binary`, the body is ndim, the shape, the number of runs, the
+    run-length encoded initial state, the number of steps, and then for each step the number
+    of changed cells followed by the packed diff.
+    The episode is simulated on the process pool, which keeps its own loaded agents.
     """
+    encoding = get_encoding()
     level_size = int(level_size)
     n_dims = int(n_dims)
     train_timesteps = int(train_timesteps)
 
-    model_class = get_model_class(model_name)
-    model_path = get_model_path(model_name, n_dims, level_size, train_timesteps)
-    model = model_class.load(model_path)
-    eval_env = Ouroboros(level_size, n_dims, render_mode="hydra")
-    evaluate_policy(model, eval_env, n_eval_episodes=1, render=True)
-    
-    states = eval_env.history[1]
-    initial_state = states[0].tolist()
-
-    diffs = []
-    for i in range(len(states)-1):
-        diffs.append(get_game_diff(states[i], states[i+1]))
+    configuration = (model_name, n_dims, level_size, train_timesteps)
+    cancel_event = new_cancel_event()
+    try:
+        initial_state, diffs = await run_in_process(simulate_agent_game_from_configuration,
+                                                    configuration, level_size, n_dims, cancel_event,
+                                                    cancel_event=cancel_event)
+    except asyncio.TimeoutError:
+        abort(504, "Agent rollout timed out")
 
-    result = {
-        "initial_state": initial_state,
-        "diffs": diffs,
-    }
+    if encoding == "binary":
+        rle_state = rle_encode(initial_state)
+        sections = [[initial_state.ndim, *initial_state.shape, len(rle_state) // 2], rle_state, [len(diffs)]]
+        for diff_indices, diff_values in diffs:
+            sections.append([len(diff_indices)])
+            sections.append(pack_diff(diff_indices, diff_values))
+        return binary_response(np.concatenate(sections))
+    if encoding == "base64":
+        result = {
+            "initial_state": to_base64(rle_encode(initial_state)),
+            "shape": list(initial_state.shape),
+            "diffs": [to_base64(pack_diff(*diff)) for diff in diffs],
+        }
+    else:
+        result = {
+            "initial_state": initial_state.tolist(),
+            "diffs": [diff_to_dict(*diff) for diff in diffs],
+        }
 
     return jsonify(result)
 
 
-@app.route("/available_agent_configurations")
-def get_available_agent_configurations():
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_frames(frames, cancel_event):
     """
-    Returns the list of trained agent configurations that ready to be visualized.
+    Yields the frames a worker puts on the `frames` queue until it is done, and raises the
+    worker's exception if it failed. The worker is cancelled when the generator is closed
+    early, e.g. because the client disconnected, or when no frame arrives for ROLLOUT_TIMEOUT
+    seconds, which raises queue.Empty.
+    """
+    try:
+        while True:
+            frame = frames.get(timeout=ROLLOUT_TIMEOUT)
+            if frame is None:
+                return
+            if isinstance(frame, Exception):
+                raise frame
+            yield frame
+    finally:
+        cancel_event.set()
+
+
+@app.route("/game_from_agent_stream/<level_size>/<n_dims>/<model_name>/<train_timesteps>")
+def stream_game_from_agent(level_size: int, n_dims: int, model_name: str, train_timesteps: int):
+    """
+    Streams a simulated game as the agent plays it, so the first frames arrive right away and
+    the episode is never held in memory. The rollout stops as soon as the client disconnects
+    and the response generator is closed. Sends Server-Sent Events: `initial_state`, then
+    `diffs` events holding up to `batch_size` consecutive diffs, then `end`. The episode is
+    played on the process pool, and its frames are sent back through a bounded queue.
+    With `encoding=base64`, states and diffs are encoded like in /game_from_agent. With
+    `encoding=binary`, sends a chunked octet-stream laid out like the binary /game_from_agent
+    response without the number of steps, ended by a step with -1 changed cells.
+    """
+    encoding = get_encoding()
+    batch_size = int(request.args.get("batch_size", STREAM_BATCH_SIZE))
+    level_size = int(level_size)
+    n_dims = int(n_dims)
+    train_timesteps = int(train_timesteps)
+
+    configuration = (model_name, n_dims, level_size, train_timesteps)
+    frames = get_process_manager().Queue(maxsize=STREAM_QUEUE_SIZE)
+    cancel_event = new_cancel_event()
+    get_process_pool().submit(stream_agent_game_from_configuration, configuration, level_size, n_dims,
+                              batch_size, frames, cancel_event)
+    agent_game = stream_frames(frames, cancel_event)
+    try:
+        initial_state = next(agent_game)
+    except queue.Empty:
+        abort(504, "Agent rollout timed out")
+
+    if encoding == "binary":
+        def generate_chunks():
+            rle_state = rle_encode(initial_state)
+            header = [initial_state.ndim, *initial_state.shape, len(rle_state) // 2]
+            yield np.concatenate([header, rle_state]).astype(WIRE_DTYPE).tobytes()
+            for batch in agent_game:
+                sections = []
+                for diff_indices, diff_values in batch:
+                    sections.append([len(diff_indices)])
+                    sections.append(pack_diff(diff_indices, diff_values))
+                yield np.concatenate(sections).astype(WIRE_DTYPE).tobytes()
+            yield np.array([-1], dtype=WIRE_DTYPE).tobytes()
+
+        return Response(generate_chunks(), mimetype="application/octet-stream")
+
+    def generate_events():
+        if encoding == "base64":
+            yield sse_event("initial_state", {"initial_state": to_base64(rle_encode(initial_state)),
+                                              "shape": list(initial_state.shape)})
+        else:
+            yield sse_event("initial_state", {"initial_state": initial_state.tolist()})
+        for batch in agent_game:
+            if encoding == "base64":
+                yield sse_event("diffs", [to_base64(pack_diff(*diff)) for diff in batch])
+            else:
+                yield sse_event("diffs", [diff_to_dict(*diff) for diff in batch])
+        yield sse_event("end", {})
+
+    return Response(generate_events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+def list_agent_configurations() -> list:
     """
-    model_configurations = []
-    for filename in sorted(os.listdir("models")):
-        model_path = os.path.join("models", filename)
+    Returns the configurations of the built-in planning agents and of the trained agents saved
+    in the models directory.
+    """
+    model_configurations = [list(configuration) for configuration in PLANNER_CONFIGURATIONS]
+    if not os.path.isdir(MODELS_DIR):
+        return model_configurations
+    for filename in sorted(os.listdir(MODELS_DIR)):
+        model_path = os.path.join(MODELS_DIR, filename)
         if os.path.isfile(model_path):
             configuration = list(get_model_configuration_from_filename(filename))
             model_configurations.append(configuration)
 
-    result = {"configurations": model_configurations}
+    return model_configurations
+
+
+@app.route("/available_agent_configurations")
+def get_available_agent_configurations():
+    """
+    Returns the list of trained agent configurations that ready to be visualized.
+    """
+    result = {"configurations": list_agent_configurations()}
+
+    return jsonify(result)
+
+
+@app.route("/metrics")
+def get_metrics():
+    """
+    Returns server counters and, when the server runs with OUROBOROS_PROFILE=1, the number of
+    calls, total time and mean time of every request endpoint and game phase.
+    """
+    result = {
+        "profiling": profiler is not None,
+        "sessions": len(sessions),
+        "phases": profiler.stats() if profiler is not None else {},
+    }
 
     return jsonify(result)
+
+
+def start_preload() -> None:
+    """
+    Starts the manager process and the process pool workers, which load the agents when they
+    start, so that the first requests skip deserialization.
+    """
+    get_process_manager()
+    pool = get_process_pool()
+    for _ in range(PROCESS_WORKERS):
+        pool.submit(worker_ready)
+
+
+if __name__ == "__main__":
+    start_preload()
+    app.run()
@@ -0,0 +1,83 @@
+"""
+Session store that lets the server hold many independent games at once.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from ouroboros.game import Game
+
+
+class GameSession:
+    """
+    A game owned by one client. The lock must be held while the game is read or modified.
+    """
+    def __init__(self, game: Game) -> None:
+        self.game = game
+        self.lock = threading.Lock()
+        self.last_access = time.monotonic()
+
+
+class GameSessionStore:
+    """
+    Thread-safe store mapping session ids to games. Sessions that haven't been accessed for
+    `ttl` seconds expire, and the least recently used sessions are evicted once more than
+    `max_sessions` are stored. The store lock is only held for dictionary updates, so requests
+    for different sessions run in parallel.
+    """
+    def __init__(self, max_sessions: int = 10_000, ttl: Optional[float] = 3600) -> None:
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def _evict(self, now: float) -> None:
+        """
+        Drops expired and least recently used sessions. Sessions are ordered by last access,
+        so only the front of the store has to be checked. Must be called with the lock held.
+        """
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            expired = self.ttl is not None and now - session.last_access > self.ttl
+            if not expired and len(self.sessions) <= self.max_sessions:
+                break
+            del self.sessions[session_id]
+
+    def create(self, game: Game) -> str:
+        """
+        Stores a game in a new session and returns the session id.
+        """
+        session_id = uuid.uuid4().hex
+        session = GameSession(game)
+        with self.lock:
+            self.sessions[session_id] = session
+            self._evict(session.last_access)
+
+        return session_id
+
+    def get(self, session_id: str) -> Optional[GameSession]:
+        """
+        Returns the session with the given id, or None when it doesn't exist or has expired.
+        """
+        now = time.monotonic()
+        with self.lock:
+            self._evict(now)
+            session = self.sessions.get(session_id)
+            if session is None:
+                return None
+            session.last_access = now
+            self.sessions.move_to_end(session_id)
+
+        return session
+
+    def remove(self, session_id: str) -> None:
+        """
+        Removes a session if it exists.
+        """
+        with self.lock:
+            self.sessions.pop(session_id, None)
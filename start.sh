@@ -1 +1 @@
-(python -m flask --app server run) & (cd hydra || exit; npm start)
\ No newline at end of file
+(python server.py) & (cd hydra || exit; npm start)
\ No newline at end of file
@@ -4,37 +4,50 @@ Training agents to play Ouroboros using reinforcement learning.
 
 import time
 import os
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
+import numpy as np
 from stable_baselines3 import PPO
 from stable_baselines3.dqn import DQN
 
 from stable_baselines3.common.env_checker import check_env
+from stable_baselines3.common.vec_env import SubprocVecEnv
 from stable_baselines3.common.evaluation import evaluate_policy
 
 from ouroboros.environment import Ouroboros
+from ouroboros.vector_env import OuroborosVectorEnv, OuroborosSB3VecEnv
+from ouroboros.planning import PlanningAgent
 
 MODEL_NAME = "ppo"
 N_DIMS = 2
 LEVEL_SIZE = 5
 TOTAL_TRAIN_TIMESTEPS = 5_000_000
+N_ENVS = 16
+VEC_ENVS = ["batched", "subproc"]
 N_EVAL_EPISODES = 100
 RENDER = False
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
 
 
 def get_model_class(model_name: str):
     """
-    Returns the model class given the model's name.
+    Returns the model class given the model's name. The "planner" agent needs no training,
+    so its load() doesn't read a saved model.
     """
     MODEL_DICT = {
         "dqn": DQN,
         "ppo": PPO,
+        "planner": PlanningAgent,
     }
 
     return MODEL_DICT[model_name]
 
 
 def get_model_path(model_name, n_dims, level_size, timesteps):
-    return f"models/{model_name}_{n_dims}_{level_size}_{timesteps}"
+    return os.path.join(MODELS_DIR, f"{model_name}_{n_dims}_{level_size}_{timesteps}")
 
 
 def get_model_configuration_from_filename(model_filename: str):
@@ -51,69 +64,205 @@ def get_model_configuration_from_filename(model_filename: str):
     return model_name, n_dims, level_size, timesteps
 
 
-def train(level_size, n_dims, model_name, n_eval_episodes, timesteps, save_path):
+def make_env(level_size, n_dims):
     """
-    Main method for training reinforcement learning agents.
+    Returns a picklable constructor of an Ouroboros env, for SubprocVecEnv workers.
     """
-    env = Ouroboros(level_size, n_dims)
-    eval_env = Ouroboros(level_size, n_dims, render_mode="human")
+    def _init():
+        return Ouroboros(level_size, n_dims)
+
+    return _init
+
+
+def make_train_env(level_size, n_dims, n_envs, vec_env="batched"):
+    """
+    Returns the vectorized training env. "batched" steps all games together in one process with
+    an OuroborosVectorEnv, and "subproc" runs one Ouroboros env per subprocess.
+    """
+    if vec_env == "batched":
+        return OuroborosSB3VecEnv(OuroborosVectorEnv(n_envs, level_size, n_dims))
+    if vec_env == "subproc":
+        return SubprocVecEnv([make_env(level_size, n_dims) for _ in range(n_envs)],
+                             start_method="spawn")
+    raise ValueError(f"Unknown vec_env {vec_env}, expected one of {VEC_ENVS}")
+
+
+def evaluate(model, level_size, n_dims, n_eval_episodes, n_envs=N_ENVS, deterministic=True,
+             seed=None) -> dict:
+    """
+    Evaluates a model on `n_eval_episodes` episodes played on a headless OuroborosVectorEnv,
+    with one batched model.predict call per step for all envs. Like evaluate_policy, the
+    episodes are split evenly between the envs so that short episodes aren't over-represented.
+    Returns the mean and std of the episode rewards, the win rate and the env steps per second.
+    """
+    n_envs = max(1, min(n_envs, n_eval_episodes))
+    env = OuroborosVectorEnv(n_envs, level_size, n_dims)
+    targets = np.array([(n_eval_episodes + i) // n_envs for i in range(n_envs)])
+    counts = np.zeros(n_envs, dtype=int)
+    current_rewards = np.zeros(n_envs)
+    episode_rewards = []
+    n_wins = 0
+    n_steps = 0
+
+    start = time.perf_counter()
+    observations, _ = env.reset(seed=seed)
+    while np.any(counts < targets):
+        n_steps += int(np.count_nonzero(counts < targets))
+        actions, _ = model.predict(observations, deterministic=deterministic)
+        observations, rewards, terminations, truncations, _ = env.step(actions)
+        current_rewards += rewards
+
+        done = terminations | truncations
+        for i in np.flatnonzero(done & (counts < targets)):
+            episode_rewards.append(current_rewards[i])
+            n_wins += bool(terminations[i] and rewards[i] >= 1000)
+            counts[i] += 1
+        current_rewards[done] = 0
+    elapsed = time.perf_counter() - start
+
+    return {
+        "mean_reward": float(np.mean(episode_rewards)),
+        "std_reward": float(np.std(episode_rewards)),
+        "win_rate": n_wins / len(episode_rewards),
+        "steps_per_sec": n_steps / elapsed,
+        "time_elapsed": elapsed,
+    }
+
+
+def print_evaluation(label, results):
+    print(f"{label} - mean reward: {results['mean_reward']:.2f} +/- {results['std_reward']:.2f}"
+          f" - win rate: {results['win_rate']:.2%} - steps/sec: {results['steps_per_sec']:.0f}"
+          f" - time elapsed: {results['time_elapsed']}")
+
+
+def train(level_size, n_dims, model_name, n_eval_episodes, timesteps, save_path, n_envs=N_ENVS,
+          vec_env="batched", progress_bar=True):
+    """
+    Main method for training reinforcement learning agents. Rollouts are collected from
+    `n_envs` games vectorized as selected by `vec_env` (see make_train_env).
+    """
+    env = make_train_env(level_size, n_dims, n_envs, vec_env)
     # check_env(env)
     model_class = get_model_class(model_name)
     model = model_class('MlpPolicy', env, verbose=0)
 
-    start = time.time()
-    mean_reward, std_reward = evaluate_policy(model, eval_env,
-                                              n_eval_episodes=n_eval_episodes,
-                                              warn=True)
-    end = time.time()
-    print(f"random agent - mean reward: {mean_reward:.2f} +/- {std_reward:.2f} - time elapsed: {end-start}")
+    print_evaluation("random agent", evaluate(model, level_size, n_dims, n_eval_episodes, n_envs))
 
     start = time.time()
-    model.learn(total_timesteps=timesteps, progress_bar=True)
+    model.learn(total_timesteps=timesteps, progress_bar=progress_bar)
     end = time.time()
     print(f"model learning - time elapsed: {end-start}")
     model.save(save_path)
+    env.close()
 
-    start = time.time()
-    mean_reward, std_reward = evaluate_policy(model, eval_env, n_eval_episodes=n_eval_episodes, render=False)
-    end = time.time()
-    print(f"trained agent - mean reward: {mean_reward:.2f} +/- {std_reward:.2f} - time elapsed: {end-start}")
+    print_evaluation("trained agent", evaluate(model, level_size, n_dims, n_eval_episodes, n_envs))
 
 
-def test(model_name, n_dims, level_size, timesteps, n_eval_episodes, render):
+def test(model_name, n_dims, level_size, timesteps, n_eval_episodes, render, n_envs=N_ENVS):
     """
-    Testing trained agents on a loaded model.
+    Testing trained agents on a loaded model. Episodes are only played one at a time on a
+    window when `render` is set.
     """
     model_class = get_model_class(model_name)
     model_path = get_model_path(model_name, n_dims, level_size, timesteps)
     model = model_class.load(model_path)
-    eval_env = Ouroboros(level_size, n_dims, render_mode="human")
 
-    start = time.time()
-    mean_reward, std_reward = evaluate_policy(model, eval_env, n_eval_episodes=n_eval_episodes, render=render)
-    end = time.time()
-    print(f"trained agent - mean reward: {mean_reward:.2f} +/- {std_reward:.2f} - time elapsed: {end-start}")
+    if render:
+        eval_env = Ouroboros(level_size, n_dims, render_mode="human")
+        start = time.time()
+        mean_reward, std_reward = evaluate_policy(model, eval_env, n_eval_episodes=n_eval_episodes, render=render)
+        end = time.time()
+        print(f"trained agent - mean reward: {mean_reward:.2f} +/- {std_reward:.2f} - time elapsed: {end-start}")
+        eval_env.close()
+    else:
+        print_evaluation("trained agent", evaluate(model, level_size, n_dims, n_eval_episodes, n_envs))
 
 
-if __name__ == "__main__":
-    cmd = input("Select an option\n1: Train\n2: Evaluate\n")
-    if cmd == "1":
-        save_path = get_model_path(model_name=MODEL_NAME, n_dims=N_DIMS,
-                                level_size=LEVEL_SIZE, timesteps=TOTAL_TRAIN_TIMESTEPS)
-        if os.path.exists(save_path + ".zip"):
-            cmd = input("An agent trained with the chosen configuration already exists.\n"\
-                        "Would you like to continue?\n1: Yes\n2: No\n")
-            if cmd != "1":
-                exit(0)
-        train(level_size=LEVEL_SIZE, n_dims=N_DIMS, model_name=MODEL_NAME, 
-              n_eval_episodes=N_EVAL_EPISODES, timesteps=TOTAL_TRAIN_TIMESTEPS,
-              save_path=save_path)
-    elif cmd == "2":
-        model_path = get_model_path(model_name=MODEL_NAME, n_dims=N_DIMS,
-                                level_size=LEVEL_SIZE, timesteps=TOTAL_TRAIN_TIMESTEPS)
+def train_configuration(configuration, n_eval_episodes, n_envs, vec_env):
+    """
+    Process pool entry point that trains one (model_name, n_dims, level_size, timesteps)
+    configuration. Returns the configuration and the path the model was saved to.
+    """
+    model_name, n_dims, level_size, timesteps = configuration
+    save_path = get_model_path(model_name, n_dims, level_size, timesteps)
+    train(level_size=level_size, n_dims=n_dims, model_name=model_name,
+          n_eval_episodes=n_eval_episodes, timesteps=timesteps, save_path=save_path,
+          n_envs=n_envs, vec_env=vec_env, progress_bar=False)
+    return configuration, save_path
+
+
+def sweep(model_names, dims, sizes, timesteps, n_eval_episodes=N_EVAL_EPISODES, n_workers=1,
+          n_envs=None, vec_env="subproc", overwrite=False):
+    """
+    Trains every configuration of model_names x dims x sizes, `n_workers` at a time on a
+    process pool. By default the cores are split evenly between the workers' envs. Models are
+    saved under get_model_path, and configurations that were already trained are skipped
+    unless `overwrite` is set.
+    """
+    configurations = []
+    for model_name, n_dims, level_size in itertools.product(model_names, dims, sizes):
+        configuration = (model_name, n_dims, level_size, timesteps)
+        if not overwrite and os.path.exists(get_model_path(*configuration) + ".zip"):
+            print(f"skipping {configuration}: already trained")
+            continue
+        configurations.append(configuration)
+
+    if n_envs is None:
+        n_envs = max(1, (os.cpu_count() or 1) // n_workers)
+    os.makedirs(MODELS_DIR, exist_ok=True)
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as pool:
+        futures = [pool.submit(train_configuration, configuration, n_eval_episodes, n_envs, vec_env)
+                   for configuration in configurations]
+        for future in as_completed(futures):
+            configuration, save_path = future.result()
+            print(f"finished {configuration}: saved to {save_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and evaluate Ouroboros agents.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = subparsers.add_parser("train", help="Train every configuration of a sweep.")
+    train_parser.add_argument("--models", nargs="+", default=[MODEL_NAME], choices=["dqn", "ppo"])
+    train_parser.add_argument("--dims", nargs="+", type=int, default=[N_DIMS])
+    train_parser.add_argument("--sizes", nargs="+", type=int, default=[LEVEL_SIZE])
+    train_parser.add_argument("--timesteps", type=int, default=TOTAL_TRAIN_TIMESTEPS)
+    train_parser.add_argument("--eval_episodes", type=int, default=N_EVAL_EPISODES)
+    train_parser.add_argument("--workers", type=int, default=1,
+                              help="Number of configurations trained at once.")
+    train_parser.add_argument("--envs", type=int, default=None,
+                              help="Envs per configuration. Defaults to the cores per worker.")
+    train_parser.add_argument("--vec_env", default="subproc", choices=VEC_ENVS)
+    train_parser.add_argument("--overwrite", action="store_true",
+                              help="Retrain configurations that were already trained.")
+
+    test_parser = subparsers.add_parser("test", help="Evaluate a trained agent.")
+    test_parser.add_argument("--model", default=MODEL_NAME, choices=["dqn", "ppo"])
+    test_parser.add_argument("--dims", type=int, default=N_DIMS)
+    test_parser.add_argument("--size", type=int, default=LEVEL_SIZE)
+    test_parser.add_argument("--timesteps", type=int, default=TOTAL_TRAIN_TIMESTEPS)
+    test_parser.add_argument("--eval_episodes", type=int, default=N_EVAL_EPISODES)
+    test_parser.add_argument("--envs", type=int, default=N_ENVS,
+                             help="Number of episodes evaluated at once.")
+    test_parser.add_argument("--render", action="store_true", default=RENDER)
+
+    args = parser.parse_args()
+    if args.command == "train":
+        sweep(args.models, args.dims, args.sizes, args.timesteps,
+              n_eval_episodes=args.eval_episodes, n_workers=args.workers, n_envs=args.envs,
+              vec_env=args.vec_env, overwrite=args.overwrite)
+    elif args.command == "test":
+        model_path = get_model_path(model_name=args.model, n_dims=args.dims,
+                                    level_size=args.size, timesteps=args.timesteps)
         if not os.path.exists(model_path + ".zip"):
             print("An agent trained with the chosen configuration does not exist.")
             exit(1)
-        test(model_name=MODEL_NAME, n_dims=N_DIMS, level_size=LEVEL_SIZE,
-             timesteps=TOTAL_TRAIN_TIMESTEPS, n_eval_episodes=N_EVAL_EPISODES,
-             render=RENDER)
+        test(model_name=args.model, n_dims=args.dims, level_size=args.size,
+             timesteps=args.timesteps, n_eval_episodes=args.eval_episodes, render=args.render,
+             n_envs=args.envs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Compact encodings of game states and diffs for the Hydra API.
+
+Besides plain JSON, responses can be requested with `encoding=base64` (packed arrays as base64
+strings inside the JSON) or `encoding=binary` (raw application/octet-stream). Packed arrays are
+little-endian int32:
+    diff: idx_0, value_0, idx_1, value_1, ... (flat indices and their new values)
+    run-length encoded state: value_0, run_0, value_1, run_1, ... (over the flat state)
+"""
+import base64
+
+import numpy as np
+
+
+ENCODINGS = ["json", "base64", "binary"]
+WIRE_DTYPE = np.dtype("<i4")
+
+
+def compute_game_diff(state: np.ndarray, next_state: np.ndarray) -> "tuple[np.ndarray, np.ndarray]":
+    """
+    Returns the flat indices of the cells that differ between two states and their new values.
+    """
+    flat_next_state = next_state.reshape(-1)
+    diff_indices = np.flatnonzero(state.reshape(-1) != flat_next_state)
+    return diff_indices, flat_next_state[diff_indices]
+
+
+def diff_to_dict(diff_indices: np.ndarray, diff_values: np.ndarray) -> dict:
+    """
+    Returns a dict mapping changed flat indices to their new values.
+    """
+    return dict(zip(diff_indices.tolist(), diff_values.tolist()))
+
+
+def pack_diff(diff_indices: np.ndarray, diff_values: np.ndarray) -> np.ndarray:
+    """
+    Packs a diff into an interleaved int32 array of flat indices and values.
+    """
+    packed = np.empty(2*len(diff_indices), dtype=WIRE_DTYPE)
+    packed[0::2] = diff_indices
+    packed[1::2] = diff_values
+    return packed
+
+
+def unpack_diff(packed: np.ndarray) -> "tuple[np.ndarray, np.ndarray]":
+    """
+    Inverse of pack_diff.
+    """
+    return packed[0::2], packed[1::2]
+
+
+def rle_encode(state: np.ndarray) -> np.ndarray:
+    """
+    Run-length encodes a flattened state into an interleaved int32 array of values and run lengths.
+    """
+    flat_state = state.reshape(-1)
+    run_starts = np.flatnonzero(np.diff(flat_state)) + 1
+    run_starts = np.concatenate([[0], run_starts])
+    run_lengths = np.diff(np.concatenate([run_starts, [len(flat_state)]]))
+
+    packed = np.empty(2*len(run_starts), dtype=WIRE_DTYPE)
+    packed[0::2] = flat_state[run_starts]
+    packed[1::2] = run_lengths
+    return packed
+
+
+def rle_decode(packed: np.ndarray, shape: tuple) -> np.ndarray:
+    """
+    Inverse of rle_encode.
+    """
+    return np.repeat(packed[0::2], packed[1::2]).astype(int).reshape(shape)
+
+
+def to_base64(packed: np.ndarray) -> str:
+    return base64.b64encode(packed.astype(WIRE_DTYPE, copy=False).tobytes()).decode("ascii")
+
+
+def from_base64(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=WIRE_DTYPE)